@@ -0,0 +1,172 @@
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from blueprint_store import load_blueprint, blueprint_text_path
+from multi_form_processor import RateLimiter, identify_forms, generate_content, open_render_pool
+from rag_system import CACI_REFERENCE_PDF, open_retriever
+
+api_key = "ADD API KEY"
+
+CHECKPOINT_NAME = "checkpoint.json"
+
+
+def find_cases(input_path):
+    """List the (case_id, LA CIV 244 path, UD-105 path) packets to process
+
+    `input_path` is either a JSON manifest, a list of
+    {"case_id", "la_civ_244", "ud_105"} records with paths relative to the
+    manifest, or a directory holding one subdirectory per case with a PDF
+    whose name contains "244" and one whose name contains "105".
+    """
+    if os.path.isfile(input_path):
+        base_dir = os.path.dirname(os.path.abspath(input_path))
+        with open(input_path, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        return [
+            (str(record["case_id"]),
+             os.path.join(base_dir, record["la_civ_244"]),
+             os.path.join(base_dir, record["ud_105"]))
+            for record in records
+        ]
+
+    cases = []
+    for case_id in sorted(os.listdir(input_path)):
+        case_dir = os.path.join(input_path, case_id)
+        if not os.path.isdir(case_dir):
+            continue
+        pdfs = [name for name in sorted(os.listdir(case_dir)) if name.lower().endswith(".pdf")]
+        la_civ = [name for name in pdfs if "244" in name]
+        ud_105 = [name for name in pdfs if "105" in name]
+        if len(la_civ) != 1 or len(ud_105) != 1:
+            print(f"Skipping {case_id}: expected one LA CIV 244 and one UD-105 PDF, found {pdfs}")
+            continue
+        cases.append((case_id, os.path.join(case_dir, la_civ[0]), os.path.join(case_dir, ud_105[0])))
+    return cases
+
+
+class Checkpoint:
+    """Per-case status kept in a JSON file, rewritten atomically after every case"""
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.cases = json.load(f)
+        except (OSError, ValueError):
+            self.cases = {}
+
+    def is_done(self, case_id):
+        entry = self.cases.get(case_id)
+        return bool(entry) and entry["status"] == "done" and os.path.exists(entry["output"])
+
+    def record(self, case_id, **entry):
+        with self._lock:
+            self.cases[case_id] = dict(entry, updated=time.time())
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.cases, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+def process_case(case, output_dir, template_path, blueprint, template_txt_path, rate_limiter, form_workers,
+                 render_pool=None, caci_retriever=None):
+    """Identify the checked forms of one packet and write its combined DOCX"""
+    case_id, la_civ_path, ud_105_path = case
+    caci_forms = identify_forms(la_civ_path, api_key, rate_limiter)
+    print(f"[{case_id}] Found {len(caci_forms)} CACI forms to process")
+    return generate_content(
+        caci_forms,
+        case_pdf_path=ud_105_path,
+        template_txt_path=template_txt_path,
+        blueprint=blueprint,
+        max_workers=form_workers,
+        output_path=os.path.join(output_dir, f"{case_id}.docx"),
+        rate_limiter=rate_limiter,
+        template_path=template_path,
+        render_pool=render_pool,
+        caci_retriever=caci_retriever,
+    )
+
+
+def run_batch(input_path, output_dir, template_path, workers=2, form_workers=4, rate_limit=None, checkpoint_path=None,
+              render_workers=1):
+    """Process every packet under `input_path`, resuming after the last completed case
+
+    Cases run `workers` at a time, each filling up to `form_workers` forms
+    concurrently, and the per-form Gemini calls of every case go through one
+    rate limiter. Finished cases are recorded in the checkpoint file and skipped
+    on the next run; failed cases are retried. With `render_workers` > 1
+    forms are rendered in one process pool shared by every case. The CACI
+    reference index is opened once and shared by every case as well.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint = Checkpoint(checkpoint_path or os.path.join(output_dir, CHECKPOINT_NAME))
+
+    cases = find_cases(input_path)
+    pending = [case for case in cases if not checkpoint.is_done(case[0])]
+    print(f"{len(cases)} cases found, {len(cases) - len(pending)} already done, {len(pending)} to process")
+    if not pending:
+        return checkpoint.cases
+
+    # Compile the template once for the whole batch
+    blueprint = load_blueprint(template_path)
+    template_txt_path = blueprint_text_path(blueprint)
+    rate_limiter = RateLimiter(rate_limit)
+
+    # Open (and on a first run, embed) the CACI reference once rather than once per concurrent case
+    try:
+        caci_retriever = open_retriever(CACI_REFERENCE_PDF, api_key=api_key, rate_limiter=rate_limiter)
+    except Exception as e:
+        print(f"Could not open the CACI reference index up front, each case will open it: {str(e)}")
+        caci_retriever = None
+
+    def run(case):
+        case_id = case[0]
+        start = time.time()
+        try:
+            output_path = process_case(case, output_dir, template_path, blueprint, template_txt_path, rate_limiter,
+                                       form_workers, render_pool, caci_retriever)
+            checkpoint.record(case_id, status="done", output=output_path, seconds=round(time.time() - start, 1))
+            print(f"✓ [{case_id}] {output_path}")
+        except Exception as e:
+            checkpoint.record(case_id, status="failed", error=str(e))
+            print(f"✗ [{case_id}] {str(e)}")
+
+    render_pool = open_render_pool(render_workers, template_path, blueprint) if render_workers > 1 else None
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            list(pool.map(run, pending))
+    finally:
+        if render_pool is not None:
+            render_pool.shutdown()
+
+    failed = [case_id for case_id, entry in checkpoint.cases.items() if entry["status"] == "failed"]
+    print(f"\nBatch complete: {len(cases) - len(failed)}/{len(cases)} cases done")
+    if failed:
+        print(f"Failed (re-run to retry): {', '.join(failed)}")
+    return checkpoint.cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill the CACI forms of a directory or manifest of case packets")
+    parser.add_argument("input", help="directory with one subdirectory per case, or a JSON manifest")
+    parser.add_argument("--output-dir", default="batch_output")
+    parser.add_argument("--template", default="Master LAFLA Template", help="master CACI template (.docx)")
+    parser.add_argument("--workers", type=int, default=2, help="cases processed concurrently")
+    parser.add_argument("--form-workers", type=int, default=4, help="forms filled concurrently per case")
+    parser.add_argument("--rate", type=float, default=None, help="maximum Gemini calls started per second, across all cases")
+    parser.add_argument("--render-workers", type=int, default=1,
+                        help="processes rendering forms, shared by all cases (default: render in-process)")
+    parser.add_argument("--checkpoint", default=None, help=f"checkpoint file (default: <output-dir>/{CHECKPOINT_NAME})")
+    args = parser.parse_args()
+
+    run_batch(args.input, args.output_dir, args.template, args.workers, args.form_workers, args.rate, args.checkpoint,
+              args.render_workers)
+
+
+if __name__ == "__main__":
+    main()
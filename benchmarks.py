@@ -0,0 +1,163 @@
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+def synthetic_embeddings(n, dim, n_clusters=200, seed=0):
+    """Clustered unit vectors that look roughly like text embeddings"""
+    from rag_system import normalize
+
+    rng = np.random.default_rng(seed)
+    centers = normalize(rng.standard_normal((n_clusters, dim)).astype(np.float32))
+    # Noise of about the same norm as the cluster centre keeps clusters overlapping
+    noise = rng.standard_normal((n, dim)).astype(np.float32) / np.sqrt(dim)
+    points = centers[rng.integers(n_clusters, size=n)] + noise
+    return normalize(points.astype(np.float32))
+
+
+def retrieval_benchmark(args):
+    """Recall@k and latency of the IVF index against exact search"""
+    from rag_system import IVFIndex, exact_search, normalize
+
+    if args.index_dir:
+        matrix = np.load(f"{args.index_dir}/embeddings.npy", mmap_mode="r")
+    else:
+        matrix = synthetic_embeddings(args.n, args.dim, seed=args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    noise = 0.5 * rng.standard_normal((args.queries, matrix.shape[1])).astype(np.float32) / np.sqrt(matrix.shape[1])
+    queries = normalize(matrix[rng.choice(len(matrix), size=args.queries)] + noise)
+
+    start = time.perf_counter()
+    truth = [exact_search(matrix, q, args.k) for q in queries]
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    print(f"{len(matrix)} vectors x {matrix.shape[1]} dims, k={args.k}")
+    print(f"exact          recall 1.000  {exact_ms:8.3f} ms/query")
+
+    start = time.perf_counter()
+    ivf = IVFIndex.build(matrix, args.n_lists)
+    print(f"IVF build ({len(ivf.centroids)} lists): {time.perf_counter() - start:.2f} s")
+
+    for nprobe in args.nprobe:
+        start = time.perf_counter()
+        found = [ivf.search(matrix, q, args.k, nprobe) for q in queries]
+        ivf_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        recall = np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)])
+        print(f"ivf nprobe={nprobe:<3} recall {recall:.3f}  {ivf_ms:8.3f} ms/query")
+
+
+def synthetic_packet(n_forms, paragraphs, runs, seed=0):
+    """Filled forms shaped like model output, with the handful of formats real templates use"""
+    rng = np.random.default_rng(seed)
+    styles = ["Normal", "Heading 1", "List Paragraph", "Body Text"]
+    colors = [None, "000000", "#FF0000", "auto"]
+    forms = []
+    for form_index in range(n_forms):
+        form_data = []
+        for _ in range(paragraphs):
+            form_data.append({
+                "style": styles[rng.integers(len(styles))],
+                "runs": [{
+                    "text": "The plaintiff & defendant <lease> agreement, paragraph text " * int(rng.integers(1, 4)),
+                    "bold": bool(rng.random() < 0.2),
+                    "italic": bool(rng.random() < 0.1),
+                    "color": colors[rng.integers(len(colors))],
+                } for _ in range(runs)],
+            })
+        forms.append((str(4300 + form_index), "Synthetic instruction", form_data))
+    return forms
+
+
+def render_benchmark(args):
+    """Time the python-docx object layer against direct WordprocessingML for one combined packet"""
+    import copy
+    import tempfile
+    from docx import Document
+    from docx_renderer import DocxBuilder, init_fragment_worker, render_form_xml
+    from multi_form_processor import add_form_to_document
+
+    forms = synthetic_packet(args.forms, args.paragraphs, args.runs, args.seed)
+    total_runs = args.forms * args.paragraphs * args.runs
+    print(f"{args.forms} forms, {args.forms * args.paragraphs} paragraphs, {total_runs} runs")
+
+    def render_python_docx(path):
+        doc = Document()
+        for i, (caci_number, title, form_data) in enumerate(copy.deepcopy(forms)):
+            add_form_to_document(doc, caci_number, title, form_data)
+            if i < len(forms) - 1:
+                doc.add_page_break()
+        doc.save(path)
+
+    def render_fast(path):
+        doc = DocxBuilder()
+        for i, (caci_number, title, form_data) in enumerate(forms):
+            doc.add_form(caci_number, title, form_data)
+            if i < len(forms) - 1:
+                doc.add_page_break()
+        doc.save(path)
+
+    def render_parallel(path):
+        doc = DocxBuilder()
+        fragments = [render_pool.submit(render_form_xml, caci_number, title, form_data)
+                     for caci_number, title, form_data in forms]
+        for i, fragment in enumerate(fragments):
+            doc.add_xml(fragment.result())
+            if i < len(forms) - 1:
+                doc.add_page_break()
+        doc.save(path)
+
+    layout = DocxBuilder().layout  # build the base package outside the timings
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+            ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"),
+                                initializer=init_fragment_worker, initargs=(layout,)) as render_pool:
+        start = time.perf_counter()
+        list(render_pool.map(_timed, [time.sleep] * args.workers, [0.1] * args.workers))
+        print(f"render pool start ({args.workers} processes): {(time.perf_counter() - start - 0.1) * 1000:.0f} ms")
+
+        renderers = [("python-docx", render_python_docx), ("direct XML", render_fast),
+                     (f"{args.workers} processes", render_parallel)]
+        for name, render in renderers:
+            path = os.path.join(tmp_dir, f"{name}.docx")
+            best = min(_timed(render, path) for _ in range(args.repeat))
+            print(f"{name:<12} {best * 1000:10.1f} ms  {os.path.getsize(path) / 1024:8.0f} KB")
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Performance benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    retrieval = subparsers.add_parser("retrieval", help="exact vs IVF retrieval")
+    retrieval.add_argument("--index-dir", help="use the embeddings of a saved DocumentRetriever index")
+    retrieval.add_argument("--n", type=int, default=100000, help="synthetic vectors")
+    retrieval.add_argument("--dim", type=int, default=768)
+    retrieval.add_argument("--queries", type=int, default=200)
+    retrieval.add_argument("--k", type=int, default=5)
+    retrieval.add_argument("--n-lists", type=int, default=None)
+    retrieval.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    retrieval.add_argument("--seed", type=int, default=0)
+    retrieval.set_defaults(func=retrieval_benchmark)
+
+    render = subparsers.add_parser("render", help="python-docx vs direct XML rendering of a combined packet")
+    render.add_argument("--forms", type=int, default=50)
+    render.add_argument("--paragraphs", type=int, default=40, help="paragraphs per form")
+    render.add_argument("--runs", type=int, default=5, help="runs per paragraph")
+    render.add_argument("--repeat", type=int, default=3)
+    render.add_argument("--workers", type=int, default=os.cpu_count(), help="processes for per-form fragment rendering")
+    render.add_argument("--seed", type=int, default=0)
+    render.set_defaults(func=render_benchmark)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+import hashlib
+import json
+import os
+import re
+import threading
+
+from docx import Document
+from docx.shared import RGBColor
+
+# Compiled template blueprints live here, one artifact per template hash
+BLUEPRINT_DIR = "blueprints"
+BLUEPRINT_VERSION = 4
+
+PLACEHOLDER_COLOR = RGBColor(0xFF, 0, 0)
+
+# A form starts at a heading such as "4329. Affirmative Defense—..." or "CACI No. 101 ..."
+FORM_HEADING = re.compile(r'^\s*(?:CACI\s*(?:No\.?)?\s*(\d{3,4}[A-Z]?)\.?|(\d{3,4}[A-Z]?)\.)\s+\S')
+HEADING_STYLE = re.compile(r'^(Heading|Title)\b', re.I)
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+class ParagraphRecord:
+    """A template paragraph: the format holding its style and its slice of the run table"""
+    __slots__ = ("format_id", "first_run", "run_count")
+
+    def __init__(self, format_id, first_run, run_count):
+        self.format_id = format_id
+        self.first_run = first_run
+        self.run_count = run_count
+
+    def to_json(self):
+        return [self.format_id, self.first_run, self.run_count]
+
+
+class RunRecord:
+    """A template run: its text and the id of its (style, bold, italic, color) format"""
+    __slots__ = ("text", "format_id")
+
+    def __init__(self, text, format_id):
+        self.text = text
+        self.format_id = format_id
+
+    def to_json(self):
+        return [self.text, self.format_id]
+
+
+def is_form_heading(para, heading):
+    """Whether a paragraph matching FORM_HEADING really starts a form
+
+    A bare "2019. The landlord ..." in body text is not a heading: the number
+    must be written as "CACI No. ...", or the paragraph must have a heading
+    style or be set entirely in bold.
+    """
+    if heading.group(1):
+        return True
+    if HEADING_STYLE.match(para.style.name or ""):
+        return True
+    runs = [run for run in para.runs if run.text.strip()]
+    return bool(runs) and all(run.bold for run in runs)
+
+
+def compile_blueprint(template_path):
+    """Analyze a Word template once into format, paragraph, run and placeholder tables
+
+    formats:      [style, bold, italic, color], each distinct tuple once
+    paragraphs:   ParagraphRecord(format_id, first_run, run_count)
+    runs:         RunRecord(text, format_id)
+    placeholders: [paragraph_index, run_position, placeholder_text]
+    forms:        {caci_number: [first_paragraph, end_paragraph]}
+    """
+    doc = Document(template_path)
+    formats = []
+    format_ids = {}
+    paragraphs = []
+    runs = []
+    placeholders = []
+    forms = {}
+    current_form = None
+
+    def intern(fmt):
+        format_id = format_ids.get(fmt)
+        if format_id is None:
+            format_id = format_ids[fmt] = len(formats)
+            formats.append(fmt)
+        return format_id
+
+    for para_index, para in enumerate(doc.paragraphs):
+        heading = FORM_HEADING.match(para.text)
+        if heading and is_form_heading(para, heading):
+            if current_form is not None:
+                forms[current_form][1] = para_index
+            current_form = heading.group(1) or heading.group(2)
+            forms[current_form] = [para_index, para_index]
+
+        style = para.style.name
+        first_run = len(runs)
+        for position, run in enumerate(para.runs):
+            color = run.font.color.rgb if run.font.color and run.font.color.rgb else None
+            runs.append(RunRecord(run.text, intern((style, run.bold, run.italic, str(color) if color else None))))
+
+            # Placeholders are red runs containing '#'
+            if '#' in run.text and color == PLACEHOLDER_COLOR:
+                placeholders.append([para_index, position, run.text.strip()])
+
+        paragraphs.append(ParagraphRecord(intern((style, None, None, None)), first_run, len(runs) - first_run))
+
+    if current_form is not None:
+        forms[current_form][1] = len(paragraphs)
+
+    return {
+        "version": BLUEPRINT_VERSION,
+        "formats": formats,
+        "paragraphs": paragraphs,
+        "runs": runs,
+        "placeholders": placeholders,
+        "forms": forms,
+    }
+
+
+def _from_json(blueprint):
+    """Turn the stored table rows back into format tuples and records"""
+    blueprint["formats"] = [tuple(fmt) for fmt in blueprint["formats"]]
+    blueprint["paragraphs"] = [ParagraphRecord(*row) for row in blueprint["paragraphs"]]
+    blueprint["runs"] = [RunRecord(*row) for row in blueprint["runs"]]
+    return blueprint
+
+
+def _to_json(blueprint):
+    return dict(
+        blueprint,
+        formats=[list(fmt) for fmt in blueprint["formats"]],
+        paragraphs=[para.to_json() for para in blueprint["paragraphs"]],
+        runs=[run.to_json() for run in blueprint["runs"]],
+    )
+
+
+def to_template_data(blueprint, first=0, end=None):
+    """Expand a compiled blueprint (or paragraphs first..end of it) into the per-paragraph dicts analyze_template returns"""
+    formats = blueprint["formats"]
+    runs = blueprint["runs"]
+    paragraphs = blueprint["paragraphs"]
+    end = len(paragraphs) if end is None else end
+    template_data = []
+    for para in paragraphs[first:end]:
+        para_runs = []
+        for run in runs[para.first_run:para.first_run + para.run_count]:
+            _, bold, italic, color = formats[run.format_id]
+            para_runs.append({"text": run.text, "bold": bold, "italic": italic, "color": color})
+        template_data.append({"style": formats[para.format_id][0], "runs": para_runs, "placeholders": []})
+    for placeholder_id, (para_index, position, placeholder) in enumerate(blueprint["placeholders"]):
+        if first <= para_index < end:
+            template_data[para_index - first]["placeholders"].append({
+                "placeholder": placeholder,
+                "position": position,
+                "id": str(placeholder_id)
+            })
+    return template_data
+
+
+def blueprint_to_text(blueprint, first=0, end=None):
+    """Compact JSON-lines text of template paragraphs, the format the model is given the template in
+
+    The first line maps the format ids used to their style and run
+    formatting; every following line is one paragraph as
+    {"format": id, "runs": [{"text": ..., "format": id}]}.
+    """
+    runs = blueprint["runs"]
+    paragraphs = blueprint["paragraphs"][first:end]
+    used = set()
+    lines = []
+    for para in paragraphs:
+        para_runs = runs[para.first_run:para.first_run + para.run_count]
+        used.add(para.format_id)
+        used.update(run.format_id for run in para_runs)
+        lines.append(json.dumps({
+            "format": para.format_id,
+            "runs": [{"text": run.text, "format": run.format_id} for run in para_runs],
+        }, ensure_ascii=False))
+    formats = {
+        str(format_id): dict(zip(("style", "bold", "italic", "color"), blueprint["formats"][format_id]))
+        for format_id in sorted(used)
+    }
+    return "\n".join([json.dumps({"formats": formats}, ensure_ascii=False)] + lines)
+
+
+# Tells the model how to answer for a template given as blueprint_to_text
+COMPACT_FORMAT_NOTE = ('Keep every "format" id exactly as given; they stand for the style and run formatting '
+                       'listed on the first line of the template.')
+
+
+def expand_form(form_data, blueprint):
+    """Turn compact {"format", "runs": [{"text", "format"}]} paragraphs from the model back into style/run dicts"""
+    formats = blueprint["formats"]
+    default = ("Normal", None, None, None)
+
+    def format_of(entry):
+        format_id = entry.get("format") if isinstance(entry, dict) else None
+        if isinstance(format_id, int) and 0 <= format_id < len(formats):
+            return formats[format_id]
+        return default
+
+    expanded = []
+    for para in form_data:
+        if not isinstance(para, dict):
+            continue
+        runs = []
+        for run in para.get("runs", []):
+            _, bold, italic, color = format_of(run)
+            runs.append({"text": run.get("text", "") if isinstance(run, dict) else str(run),
+                         "bold": bold, "italic": italic, "color": color})
+        expanded.append({"style": format_of(para)[0], "runs": runs})
+    return expanded
+
+
+def normalize_caci_number(caci_number):
+    """'CACI No. 4329' / 4329 / ' 4329 ' -> '4329'"""
+    match = re.search(r'\d{3,4}[A-Z]?', str(caci_number).upper())
+    return match.group(0) if match else str(caci_number).strip()
+
+
+def form_range(blueprint, caci_number):
+    """(first, end) paragraph range of a CACI form in the template, or None"""
+    bounds = blueprint.get("forms", {}).get(normalize_caci_number(caci_number))
+    return tuple(bounds) if bounds else None
+
+
+def form_slice(blueprint, caci_number):
+    """The template paragraphs of a single CACI form, or None if it is not indexed"""
+    bounds = form_range(blueprint, caci_number)
+    if bounds is None:
+        return None
+    first, end = bounds
+    return to_template_data(blueprint, first, end)
+
+
+def form_text(blueprint, caci_number):
+    """The compact model text of a single CACI form, or None if it is not indexed"""
+    bounds = form_range(blueprint, caci_number)
+    if bounds is None:
+        return None
+    first, end = bounds
+    return blueprint_to_text(blueprint, first, end)
+
+
+def paragraphs_to_text(template_data):
+    """Paragraph-per-line JSON text of expanded template data (templates without a blueprint)"""
+    return "\n".join(json.dumps(para, ensure_ascii=False) for para in template_data)
+
+
+def _template_hash(template_path, store_dir):
+    """SHA-256 of the template, skipping the read when its mtime and size are unchanged"""
+    index_path = os.path.join(store_dir, "index.json")
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+
+    stat = os.stat(template_path)
+    key = os.path.abspath(template_path)
+    known = index.get(key)
+    if known and known["mtime_ns"] == stat.st_mtime_ns and known["size"] == stat.st_size:
+        return known["sha256"]
+
+    with open(template_path, "rb") as f:
+        sha256 = hashlib.sha256(f.read()).hexdigest()
+
+    index[key] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": sha256}
+    _write_json(index, index_path)
+    return sha256
+
+
+def _write_json(data, path):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def blueprint_text_path(blueprint, store_dir=BLUEPRINT_DIR):
+    """Path of the compact paragraph-per-line text rendering that is uploaded to Gemini"""
+    return os.path.join(store_dir, f"{blueprint['sha256']}.txt")
+
+
+def load_blueprint(template_path, store_dir=BLUEPRINT_DIR):
+    """Load the compiled blueprint for a template, compiling it only if it changed"""
+    os.makedirs(store_dir, exist_ok=True)
+
+    with _lock:
+        sha256 = _template_hash(template_path, store_dir)
+        blueprint = _loaded.get(sha256)
+        if blueprint is not None:
+            return blueprint
+
+        artifact_path = os.path.join(store_dir, f"{sha256}.json")
+        try:
+            with open(artifact_path, "r", encoding="utf-8") as f:
+                blueprint = json.load(f)
+        except (OSError, ValueError):
+            blueprint = None
+
+        compiled = blueprint is None or blueprint.get("version") != BLUEPRINT_VERSION
+        if compiled:
+            blueprint = compile_blueprint(template_path)
+            blueprint["sha256"] = sha256
+            _write_json(_to_json(blueprint), artifact_path)
+        else:
+            blueprint = _from_json(blueprint)
+
+        text_path = blueprint_text_path(blueprint, store_dir)
+        if compiled or not os.path.exists(text_path):
+            # Text form of the template for the model, one paragraph per line
+            with open(text_path, "w", encoding="utf-8") as out:
+                out.write(blueprint_to_text(blueprint))
+                out.write("\n")
+
+        _loaded[sha256] = blueprint
+        return blueprint
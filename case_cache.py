@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import pathlib
+import time
+
+from google.genai import types
+
+# Where cached case-info responses are kept between runs
+CASE_CACHE_DIR = "case_info_cache"
+CASE_CACHE_TTL = 7 * 24 * 60 * 60  # seconds
+CASE_CACHE_MAX_ENTRIES = 256
+
+CASE_INFO_MODEL = "gemini-2.0-flash-exp"
+CASE_INFO_PROMPT = 'Give me all information you have about the case'
+
+
+def cache_key(pdf_bytes, model, prompt):
+    """Content address for a (PDF, model, prompt) request"""
+    digest = hashlib.sha256()
+    digest.update(hashlib.sha256(pdf_bytes).digest())
+    digest.update(model.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(prompt.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def cache_get(key, cache_dir=CASE_CACHE_DIR, ttl=CASE_CACHE_TTL):
+    """Return the cached response text for `key`, or None if missing or expired"""
+    path = os.path.join(cache_dir, f"{key}.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if ttl is not None and time.time() - entry.get("created", 0) > ttl:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+
+    # Touch the entry so eviction is least-recently-used rather than oldest-first
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return entry.get("text")
+
+
+def cache_put(key, text, cache_dir=CASE_CACHE_DIR, max_entries=CASE_CACHE_MAX_ENTRIES):
+    """Store a response text under `key` and evict the least recently used entries"""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{key}.json")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"created": time.time(), "text": text}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    evict(cache_dir, max_entries)
+
+
+def evict(cache_dir=CASE_CACHE_DIR, max_entries=CASE_CACHE_MAX_ENTRIES):
+    """Remove the least recently used entries beyond `max_entries`"""
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            entries.append((os.path.getmtime(path), path))
+        except OSError:
+            continue
+
+    entries.sort(reverse=True)
+    for _, path in entries[max_entries:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def get_case_info(client, pdf_path, model=CASE_INFO_MODEL, prompt=CASE_INFO_PROMPT,
+                  cache_dir=CASE_CACHE_DIR, ttl=CASE_CACHE_TTL,
+                  max_entries=CASE_CACHE_MAX_ENTRIES, config=None, rate_limiter=None):
+    """Ask Gemini about the case in `pdf_path`, reusing a cached answer when possible
+
+    `config` is passed through to generate_content (e.g. a JSON response
+    schema); callers that use one should use a prompt of their own so its
+    answers are cached separately. A cache miss waits for a slot of
+    `rate_limiter`, when given. Returns a (text, cached) tuple.
+    """
+    pdf_bytes = pathlib.Path(pdf_path).read_bytes()
+    key = cache_key(pdf_bytes, model, prompt)
+
+    text = cache_get(key, cache_dir, ttl)
+    if text is not None:
+        return text, True
+
+    if rate_limiter:
+        rate_limiter.wait()
+    response = client.models.generate_content(
+        model=model,
+        contents=[
+            types.Part.from_bytes(
+                data=pdf_bytes,
+                mime_type='application/pdf',
+            ),
+            prompt
+        ],
+        config=config
+    )
+    text = response.text
+    if text:
+        cache_put(key, text, cache_dir, max_entries)
+    return text, False
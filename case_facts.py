@@ -0,0 +1,171 @@
+import copy
+import json
+import re
+
+from case_cache import get_case_info
+from json_parser import extract_json_object
+from structured_output import json_config, object_schema
+
+# Facts pulled out of the case PDF once per case and substituted into every form
+CASE_FACT_FIELDS = {
+    "plaintiff": "full name(s) of the plaintiff / landlord",
+    "defendant": "full name(s) of the defendant / tenant",
+    "landlord": "full name of the landlord",
+    "tenant": "full name of the tenant",
+    "address": "street address of the rental property",
+    "city": "city of the rental property",
+    "county": "county where the case is filed",
+    "zip_code": "ZIP code of the rental property",
+    "case_number": "court case number",
+    "court": "name of the court",
+    "filing_date": "date the complaint was filed",
+    "notice_date": "date the notice to quit / pay rent was served",
+    "notice_type": "type of notice served (e.g. 3-day notice to pay rent or quit)",
+    "rent_amount": "monthly rent amount",
+    "rent_due": "amount of rent claimed as due",
+    "lease_date": "date the lease or rental agreement started",
+}
+
+CASE_FACTS_PROMPT = (
+    "Extract the following facts about the case as one JSON object with exactly these keys. "
+    "Use null for anything the document does not state. Output only the JSON object.\n"
+    + "\n".join(f'"{key}": {description}' for key, description in CASE_FACT_FIELDS.items())
+)
+
+# Template text sent along with each placeholder the model is asked to fill
+PLACEHOLDER_CONTEXT_CHARS = 300
+
+# Placeholder wordings that do not contain the fact key itself
+PLACEHOLDER_ALIASES = {
+    "name_of_plaintiff": "plaintiff",
+    "name_of_defendant": "defendant",
+    "owner": "landlord",
+    "property_address": "address",
+    "premises": "address",
+    "street_address": "address",
+    "zip": "zip_code",
+    "case_no": "case_number",
+    "monthly_rent": "rent_amount",
+}
+
+# Suffixes that still ask for the fact itself, e.g. "#Plaintiff Name#" -> plaintiff
+NAME_SUFFIXES = ("_full_name", "_name")
+
+
+def extract_case_facts(client, pdf_path, rate_limiter=None):
+    """Ask Gemini once for the structured case facts (cached like the case info)"""
+    text, _ = get_case_info(client, pdf_path, prompt=CASE_FACTS_PROMPT,
+                            config=json_config(object_schema(CASE_FACT_FIELDS)), rate_limiter=rate_limiter)
+    facts = extract_json_object(text)
+    return {key: str(value).strip() for key, value in facts.items() if value not in (None, "")}
+
+
+def placeholder_key(placeholder):
+    """'#Plaintiff's Name#' -> 'plaintiff_name'"""
+    text = re.sub(r"['’]s\b", "", placeholder.lower())
+    return re.sub(r'[^a-z0-9]+', '_', text).strip('_')
+
+
+def resolve_placeholder(placeholder, facts):
+    """Value for a placeholder from the case facts, or None if it cannot be resolved
+
+    Only exact keys, aliases and a key followed by a name suffix are filled
+    locally. Anything else (e.g. "#Landlord Address#", "#Plaintiff's
+    Attorney#") only mentions a fact and is left to the model.
+    """
+    key = placeholder_key(placeholder)
+    candidates = [key] + [key[:-len(suffix)] for suffix in NAME_SUFFIXES if key.endswith(suffix)]
+    for candidate in candidates:
+        fact = PLACEHOLDER_ALIASES.get(candidate, candidate)
+        if fact in facts:
+            return facts[fact]
+    return None
+
+
+def fill_placeholders(paragraphs, values):
+    """Substitute placeholder values into a copy of the template paragraphs
+
+    `values` maps placeholder text to its replacement.
+    """
+    filled = copy.deepcopy(paragraphs)
+    for para in filled:
+        for placeholder in para.get("placeholders", []):
+            value = values.get(placeholder["placeholder"])
+            if value is None:
+                continue
+            run = para["runs"][placeholder["position"]]
+            run["text"] = run["text"].replace(placeholder["placeholder"], value)
+    return filled
+
+
+def local_fill(paragraphs, facts):
+    """Fill every placeholder the case facts can answer
+
+    Returns (values, unresolved) where `values` maps placeholder text to its
+    value and `unresolved` lists the placeholders that still need the model.
+    """
+    values = {}
+    unresolved = []
+    for para in paragraphs:
+        for placeholder in para.get("placeholders", []):
+            text = placeholder["placeholder"]
+            if text in values or text in unresolved:
+                continue
+            value = resolve_placeholder(text, facts)
+            if value is None:
+                unresolved.append(text)
+            else:
+                values[text] = value
+    return values, unresolved
+
+
+def form_placeholders(paragraphs, texts=None):
+    """The distinct placeholders of a form (or just those in `texts`), keyed by placeholder id
+
+    Each entry carries the placeholder text and the text of the paragraph it
+    appears in, so the model sees where a value goes without the whole form.
+    """
+    found = {}
+    for para in paragraphs:
+        para_text = "".join(run["text"] for run in para["runs"])
+        for placeholder in para.get("placeholders", []):
+            text = placeholder["placeholder"]
+            if (texts is not None and text not in texts) or any(entry["placeholder"] == text for entry in found.values()):
+                continue
+            placeholder_id = str(placeholder.get("id", len(found)))
+            found[placeholder_id] = {"placeholder": text, "context": para_text[:PLACEHOLDER_CONTEXT_CHARS]}
+    return found
+
+
+def resolve_with_model(client, caci_number, placeholders, cont, rate_limiter=None, shared=None):
+    """Ask Gemini only for the values of `placeholders` ({placeholder_id: {"placeholder", "context"}})
+
+    The reply is a single {placeholder_id: value} object rather than the
+    whole form, so output tokens scale with the number of placeholders.
+    Returns the values keyed by placeholder text, ready for
+    fill_placeholders. With a `shared` job context the call goes through
+    it, so a cached case summary is referenced instead of being sent again.
+    """
+    prompt = f"""Legal Document Generation Task:
+    These placeholders of CACI form {caci_number} need values, keyed by placeholder id: {json.dumps(placeholders, ensure_ascii=False)}.
+    Use this as context: {cont}. Make your best guess for every placeholder; "context" is the template text around it.
+    Output one JSON object mapping each placeholder id to the text that replaces the placeholder. Dont output anything else."""
+    config = json_config(object_schema(placeholders, required=True))
+    if rate_limiter:
+        rate_limiter.wait()
+    if shared is not None:
+        response = shared.generate(client, [prompt], config=config)
+    else:
+        response = client.models.generate_content(
+            model="gemini-2.0-flash-exp",
+            contents=[prompt],
+            config=config
+        )
+    values = {}
+    for placeholder_id, value in extract_json_object(response.text).items():
+        if placeholder_id in placeholders and value is not None:
+            values[placeholders[placeholder_id]["placeholder"]] = str(value)
+    missing = [entry["placeholder"] for entry in placeholders.values() if entry["placeholder"] not in values]
+    if missing:
+        print(f"CACI {caci_number}: no value for {', '.join(missing)}, left as in the template")
+    return values
@@ -0,0 +1,107 @@
+from google.genai import types
+
+# Must be the model of the calls that use the cache; cached contents are tied to one model, and only
+# stable (versioned) models support explicit caching
+CONTEXT_CACHE_MODEL = "gemini-2.0-flash-001"
+
+# Smallest context the model accepts as a cache; smaller contents are sent inline
+CONTEXT_CACHE_MIN_TOKENS = 4096
+
+# Text is never denser than this, so shorter text cannot reach the minimum and needs no token count
+MIN_CHARS_PER_TOKEN = 2
+
+# Long enough for one packet; the cache is deleted as soon as the job is done
+CONTEXT_CACHE_TTL = 60 * 60  # seconds
+
+# Stands in for the case summary in prompts once the summary is part of the shared context
+SHARED_CASE_INFO = "the case information given at the start of this request"
+
+
+class SharedContext:
+    """Contents every per-form call of a job starts with, sent inline with each call
+
+    This is the fallback when Gemini context caching is unavailable (and a
+    stand-in that needs no cache API when testing).
+    """
+    def __init__(self, contents, model=CONTEXT_CACHE_MODEL):
+        self.contents = list(contents)
+        self.model = model
+
+    def generate(self, client, contents, config=None):
+        return client.models.generate_content(
+            model=self.model,
+            contents=[*self.contents, *contents],
+            config=config
+        )
+
+    def close(self, client):
+        pass
+
+
+class CachedContext(SharedContext):
+    """Shared contents registered once with Gemini explicit context caching"""
+    def __init__(self, name, model=CONTEXT_CACHE_MODEL):
+        super().__init__([], model)
+        self.name = name
+
+    def generate(self, client, contents, config=None):
+        if config is None:
+            config = types.GenerateContentConfig(cached_content=self.name)
+        else:
+            config = config.model_copy(update={"cached_content": self.name})
+        return client.models.generate_content(model=self.model, contents=contents, config=config)
+
+    def close(self, client):
+        try:
+            client.caches.delete(name=self.name)
+        except Exception as e:
+            print(f"Could not delete context cache {self.name}: {str(e)}")
+
+
+def is_cacheable(client, contents, model=CONTEXT_CACHE_MODEL, min_tokens=CONTEXT_CACHE_MIN_TOKENS, rate_limiter=None):
+    """Whether `contents` reach the model's minimum cacheable size
+
+    Text that is too short for any tokenization is rejected without a call;
+    otherwise (or when a file is included) the tokens are counted.
+    """
+    if all(isinstance(content, str) for content in contents) \
+            and sum(len(content) for content in contents) < min_tokens * MIN_CHARS_PER_TOKEN:
+        return False
+    try:
+        if rate_limiter:
+            rate_limiter.wait()
+        tokens = client.models.count_tokens(model=model, contents=list(contents)).total_tokens
+    except Exception as e:
+        print(f"Could not count the shared context tokens: {str(e)}")
+        return False
+    return bool(tokens) and tokens >= min_tokens
+
+
+def open_shared_context(client, contents, model=CONTEXT_CACHE_MODEL, ttl=CONTEXT_CACHE_TTL, use_cache=True,
+                        rate_limiter=None, min_tokens=CONTEXT_CACHE_MIN_TOKENS):
+    """Register `contents` as a Gemini context cache, or fall back to sending them inline
+
+    Contents below the model's minimum cacheable size (`min_tokens`) are
+    sent inline without trying; if caching fails anyway the job still runs,
+    just without the savings.
+    """
+    if use_cache and not is_cacheable(client, contents, model, min_tokens, rate_limiter):
+        print("Shared case context is below the minimum cache size, sending it with every call")
+        use_cache = False
+    if use_cache:
+        try:
+            if rate_limiter:
+                rate_limiter.wait()
+            cache = client.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    contents=list(contents),
+                    ttl=f"{int(ttl)}s",
+                    display_name="caci-case-context",
+                )
+            )
+            print(f"Cached the shared case context as {cache.name}")
+            return CachedContext(cache.name, model)
+        except Exception as e:
+            print(f"Context caching unavailable, sending the case context with every call: {str(e)}")
+    return SharedContext(contents, model)
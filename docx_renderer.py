@@ -0,0 +1,316 @@
+import io
+import re
+import string
+import threading
+import zipfile
+from xml.sax.saxutils import escape, quoteattr
+
+from docx import Document
+from lxml import etree
+
+from blueprint_store import form_range
+
+DOCUMENT_PART = "word/document.xml"
+STYLES_PART = "word/styles.xml"
+
+# Characters WordprocessingML cannot hold, and the ones python-docx turns into elements
+INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+RUN_SPECIALS = re.compile('([\t\n\r])')
+RUN_BREAKS = re.compile('\r\n?|\n')
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+# Private-use characters that mark where the body and the placeholder texts go
+BODY_MARK = "\ue000"
+PLACEHOLDER_MARK = "\ue001"
+PLACEHOLDER_SLOT = re.compile(PLACEHOLDER_MARK + r'(\d+)' + PLACEHOLDER_MARK)
+NS_DECLARATION = re.compile(r' xmlns:(\w+)="([^"]*)"')
+
+STYLE_ENTRY = re.compile(r'<w:style\b[^>]*?w:type="paragraph"[^>]*?w:styleId="([^"]*)"[^>]*>.*?<w:name w:val="([^"]*)"', re.S)
+
+PAGE_BREAK_XML = '<w:p><w:r><w:br w:type="page"/></w:r></w:p>'
+
+_base_package = None
+_template_bodies = {}
+_lock = threading.Lock()
+
+# Per-process renderer of the form fragment workers
+_fragment_state = {}
+
+
+def base_package():
+    """The blank python-docx document every fast render starts from, built once per process"""
+    global _base_package
+    if _base_package is None:
+        buffer = io.BytesIO()
+        Document().save(buffer)
+        _base_package = buffer.getvalue()
+    return _base_package
+
+
+def hex_color(color):
+    """The RRGGBB value for a run color as the model writes it (as color_from_hex reads it), or None"""
+    if isinstance(color, list):
+        if len(color) == 3:
+            return "%02X%02X%02X" % tuple(color)
+        return None
+    if not color or not isinstance(color, str) or color.lower() == "auto":
+        return None
+    color = color.lstrip('#')
+    if len(color) == 6 and all(c in string.hexdigits for c in color):
+        return color.upper()
+    return None
+
+
+def run_text_xml(text):
+    """The run content for `text`, with tabs and line breaks as python-docx's add_run writes them"""
+    text = INVALID_XML_CHARS.sub("", str(text))
+    if not RUN_SPECIALS.search(text):
+        return f'<w:t xml:space="preserve">{escape(text)}</w:t>' if text else ""
+    parts = []
+    for piece in RUN_SPECIALS.split(text):
+        if piece == "\t":
+            parts.append('<w:tab/>')
+        elif piece in ("\n", "\r"):
+            parts.append('<w:br/>')
+        elif piece:
+            parts.append(f'<w:t xml:space="preserve">{escape(piece)}</w:t>')
+    return "".join(parts)
+
+
+def split_document(document_xml):
+    """Split document.xml into (head, body elements, tail, namespaces)
+
+    `head` ends with the opening <w:body> tag and `tail` starts with the
+    body's final section properties (page size, margins, headers); the
+    elements in between are returned detached, as lxml elements.
+    """
+    root = etree.fromstring(document_xml)
+    body = root.find(W + "body")
+    elements = list(body)
+    if elements and elements[-1].tag == W + "sectPr":
+        elements.pop()
+    for element in elements:
+        body.remove(element)
+    body.text = BODY_MARK
+    head, tail = etree.tostring(root, encoding="unicode").split(BODY_MARK)
+    return XML_DECLARATION + head, elements, tail, root.nsmap
+
+
+def package_layout(package):
+    """(head, tail, style ids by lowercase name) of a .docx package"""
+    with zipfile.ZipFile(io.BytesIO(package)) as zf:
+        document_xml = zf.read(DOCUMENT_PART)
+        styles_xml = zf.read(STYLES_PART).decode("utf-8") if STYLES_PART in zf.namelist() else ""
+    head, _, tail, _ = split_document(document_xml)
+    style_ids = {name.lower(): style_id for style_id, name in STYLE_ENTRY.findall(styles_xml)}
+    return head, tail, style_ids
+
+
+def inline_text_xml(text):
+    """`text` for use inside an open <w:t>, closing and reopening it around tabs and line breaks"""
+    text = escape(INVALID_XML_CHARS.sub("", str(text)))
+    if not RUN_SPECIALS.search(text):
+        return text
+    text = text.replace("\t", '</w:t><w:tab/><w:t xml:space="preserve">')
+    return RUN_BREAKS.sub('</w:t><w:br/><w:t xml:space="preserve">', text)
+
+
+class DocxBuilder:
+    """Writes paragraphs and runs straight into document.xml instead of through python-docx objects
+
+    Each distinct (bold, italic, color, size) tuple gets its run-properties
+    fragment built once, and the body is streamed into the package when it
+    is saved. Output matches `add_form_to_document`, except that unknown
+    style names fall back to the default paragraph style instead of raising.
+    """
+    def __init__(self, package=None, layout=None):
+        self.package = package
+        self.layout = layout or package_layout(package or base_package())
+        self.head, self.tail, self.style_ids = self.layout
+        self._rpr = {}
+        self._ppr = {}
+        self.chunks = []
+
+    def run_properties(self, bold=None, italic=None, color=None, size=None):
+        """The <w:rPr> fragment for a formatting tuple, built on first use"""
+        key = (bold, italic, color, size)
+        fragment = self._rpr.get(key)
+        if fragment is None:
+            props = []
+            if bold is not None:
+                props.append('<w:b/>' if bold else '<w:b w:val="0"/>')
+            if italic is not None:
+                props.append('<w:i/>' if italic else '<w:i w:val="0"/>')
+            if color:
+                props.append(f'<w:color w:val="{color}"/>')
+            if size:
+                props.append(f'<w:sz w:val="{int(size * 2)}"/>')
+            fragment = f'<w:rPr>{"".join(props)}</w:rPr>' if props else ""
+            self._rpr[key] = fragment
+        return fragment
+
+    def paragraph_properties(self, style):
+        fragment = self._ppr.get(style)
+        if fragment is None:
+            style_id = self.style_ids.get(str(style).lower()) if style else None
+            fragment = f'<w:pPr><w:pStyle w:val={quoteattr(style_id)}/></w:pPr>' if style_id else ""
+            self._ppr[style] = fragment
+        return fragment
+
+    def add_paragraph(self, runs, style=None):
+        """Append a paragraph; `runs` holds (text, bold, italic, color hex, size in points) tuples"""
+        parts = ['<w:p>', self.paragraph_properties(style)]
+        for text, bold, italic, color, size in runs:
+            parts.append(f'<w:r>{self.run_properties(bold, italic, color, size)}{run_text_xml(text)}</w:r>')
+        parts.append('</w:p>')
+        self.chunks.append("".join(parts))
+
+    def add_form(self, caci_number, jury_instructions, form_data):
+        """Append a title and the filled paragraphs of one form (the add_form_to_document layout)"""
+        self.add_paragraph([(f"CACI {caci_number}: {jury_instructions}", True, None, None, 14)])
+        self.add_paragraphs(form_data)
+
+    def add_paragraphs(self, form_data):
+        """Append filled paragraphs ({"style", "runs"} records) without a title"""
+        for para in form_data:
+            self.add_paragraph(
+                [(run_info["text"], run_info.get("bold", False), run_info.get("italic", False),
+                  hex_color(run_info.get("color")), None)
+                 for run_info in para["runs"]],
+                para.get("style", "Normal")
+            )
+
+    def body_xml(self):
+        """The body XML added so far"""
+        return "".join(self.chunks)
+
+    def add_xml(self, xml):
+        """Append body XML that is already WordprocessingML (e.g. a form copied from the template)"""
+        self.chunks.append(xml)
+
+    def add_error(self, message):
+        self.add_paragraph([(message, None, None, "FF0000", None)])
+
+    def add_page_break(self):
+        self.chunks.append(PAGE_BREAK_XML)
+
+    def save(self, path):
+        """Copy the base package and stream the body into its document.xml"""
+        with zipfile.ZipFile(io.BytesIO(self.package or base_package())) as source, \
+                zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as target:
+            for item in source.infolist():
+                if item.filename == DOCUMENT_PART:
+                    with target.open(DOCUMENT_PART, "w") as document:
+                        document.write(self.head.encode("utf-8"))
+                        for chunk in self.chunks:
+                            document.write(chunk.encode("utf-8"))
+                        document.write(self.tail.encode("utf-8"))
+                else:
+                    target.writestr(item, source.read(item.filename))
+
+
+def element_xml(element, nsmap):
+    """Serialize a body element without re-declaring the namespaces of the document root"""
+    xml = etree.tostring(element, encoding="unicode", with_tail=False)
+    end = xml.index(">")
+    start_tag = NS_DECLARATION.sub(lambda m: "" if nsmap.get(m.group(1)) == m.group(2) else m.group(0), xml[:end])
+    return start_tag + xml[end:]
+
+
+class TemplateBody:
+    """A template package whose body is pre-split around its placeholder runs
+
+    Built once per template. Rendering a form is a string join of the
+    template's own body XML with the filled placeholder texts, so numbering,
+    tables, fields and the styles, headers and section layout of the package
+    all come through unchanged. Only the text of placeholder runs is
+    replaced; their run properties are kept.
+    """
+    def __init__(self, package, blueprint):
+        self.package = package
+        self.blueprint = blueprint
+        with zipfile.ZipFile(io.BytesIO(package)) as zf:
+            document_xml = zf.read(DOCUMENT_PART)
+        head, elements, tail, nsmap = split_document(document_xml)
+        _, _, style_ids = package_layout(package)
+        self.layout = (head, tail, style_ids)
+
+        # python-docx counts paragraphs and runs as the direct <w:p> children of the body and <w:r> children of a paragraph
+        self.paragraph_elements = [i for i, element in enumerate(elements) if element.tag == W + "p"]
+        if len(self.paragraph_elements) != len(blueprint["paragraphs"]):
+            raise ValueError("The blueprint was compiled from a different template")
+
+        self.placeholders = []
+        for slot, (para_index, position, placeholder) in enumerate(blueprint["placeholders"]):
+            run_text = blueprint["runs"][blueprint["paragraphs"][para_index].first_run + position].text
+            run = elements[self.paragraph_elements[para_index]].findall(W + "r")[position]
+            for child in list(run):
+                if child.tag != W + "rPr":
+                    run.remove(child)
+            text = etree.SubElement(run, W + "t")
+            text.set(XML_SPACE, "preserve")
+            text.text = f"{PLACEHOLDER_MARK}{slot}{PLACEHOLDER_MARK}"
+            self.placeholders.append((placeholder, run_text))
+
+        # Literal XML alternating with placeholder slot numbers, per body element
+        self.elements = []
+        for element in elements:
+            parts = PLACEHOLDER_SLOT.split(element_xml(element, nsmap))
+            self.elements.append([part if i % 2 == 0 else int(part) for i, part in enumerate(parts)])
+
+    def builder(self):
+        """A DocxBuilder writing into a copy of this template's package"""
+        return DocxBuilder(self.package, self.layout)
+
+    def form_xml(self, caci_number, values):
+        """The template body of one form with `values` (placeholder text -> value) filled in, or None"""
+        bounds = form_range(self.blueprint, caci_number)
+        if bounds is None:
+            return None
+        first, end = bounds
+        start = self.paragraph_elements[first]
+        stop = self.paragraph_elements[end] if end < len(self.paragraph_elements) else len(self.elements)
+        out = []
+        for parts in self.elements[start:stop]:
+            for i, part in enumerate(parts):
+                if i % 2 == 0:
+                    out.append(part)
+                    continue
+                placeholder, run_text = self.placeholders[part]
+                value = values.get(placeholder)
+                out.append(inline_text_xml(run_text if value is None else run_text.replace(placeholder, value)))
+        return "".join(out)
+
+
+def load_template_body(template_path, blueprint):
+    """The TemplateBody of a template, built on first use and kept for the life of the process"""
+    with _lock:
+        body = _template_bodies.get(blueprint["sha256"])
+        if body is None:
+            with open(template_path, "rb") as f:
+                body = TemplateBody(f.read(), blueprint)
+            _template_bodies[blueprint["sha256"]] = body
+        return body
+
+
+def init_fragment_worker(layout, template_path=None, blueprint=None):
+    """Process-pool initializer: one builder, and the template body if any, per worker process"""
+    _fragment_state["builder"] = DocxBuilder(layout=layout)
+    _fragment_state["template"] = load_template_body(template_path, blueprint) if template_path else None
+
+
+def render_form_xml(caci_number, jury_instructions, form_data, from_template=False):
+    """The body XML of one form, rendered in a worker process and merged with DocxBuilder.add_xml
+
+    `form_data` is the filled paragraphs, or with `from_template` the
+    placeholder values to patch into the template body.
+    """
+    if from_template:
+        return _fragment_state["template"].form_xml(caci_number, form_data)
+    builder = _fragment_state["builder"]
+    builder.chunks = []
+    builder.add_form(caci_number, jury_instructions, form_data)
+    return builder.body_xml()
@@ -0,0 +1,94 @@
+import json
+import re
+
+from PyPDF2 import PdfReader
+
+# Optional override mapping LA CIV 244 field names to CACI numbers,
+# e.g. {"Check Box12": "4320"} for checkboxes whose names carry no number
+FIELD_MAP_PATH = "caci_field_map.json"
+
+# Titles of the instructions that appear on the LA CIV 244
+CACI_TITLES = {
+    "101": "Overview of Trial",
+    "4302": "Termination for Failure to Pay Rent—Essential Factual Elements",
+    "4303": "Sufficiency and Service of Notice of Termination for Failure to Pay Rent",
+    "4304": "Termination for Violation of Terms of Lease/Agreement—Essential Factual Elements",
+    "4305": "Sufficiency and Service of Notice of Termination for Violation of Terms of Agreement",
+    "4320": "Affirmative Defense—Implied Warranty of Habitability",
+    "4321": "Affirmative Defense—Retaliatory Eviction—Tenant's Complaint",
+    "4322": "Affirmative Defense—Retaliatory Eviction—Engaging in Legally Protected Activity",
+    "4323": "Affirmative Defense—Discriminatory Eviction",
+    "4324": "Affirmative Defense—Waiver by Acceptance of Rent",
+    "4325": "Affirmative Defense—Failure to Comply With Rent Control Ordinance",
+    "4326": "Affirmative Defense—Repair and Deduct",
+    "4327": "Affirmative Defense—Landlord's Refusal of Rent",
+    "4329": "Affirmative Defense—Failure to Provide Reasonable Accommodation",
+}
+
+CACI_NUMBER = re.compile(r'(?<!\d)(\d{3,4}[A-Z]?)(?!\d)')
+
+# Values an unchecked checkbox can have
+UNCHECKED = {None, "", "/Off", "Off", "/No", "No"}
+
+
+def load_field_map(path=FIELD_MAP_PATH):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def caci_number_for_field(name, field, field_map):
+    """CACI number a checkbox stands for, from the field map, its tooltip or its name
+
+    Only numbers of known instructions count, so generic widget names like
+    "CheckBox104" are not mistaken for a CACI number.
+    """
+    if name in field_map:
+        return str(field_map[name])
+    known = set(CACI_TITLES) | {str(number) for number in field_map.values()}
+    for label in (field.get("/TU"), name):
+        for match in CACI_NUMBER.finditer(str(label or "")):
+            if match.group(1) in known:
+                return match.group(1)
+    return None
+
+
+def identify_caci_forms(pdf_path, field_map=None):
+    """Read the checked CACI checkboxes straight from the LA CIV 244 AcroForm
+
+    Returns the same list of {"CACI Number", "Jury Instructions"} records the
+    Gemini prompt produces, in form order, or None when the model has to be
+    used: the PDF has no form fields (e.g. it was flattened or scanned), or
+    a checked checkbox cannot be mapped to a CACI number, since a partial
+    list would silently drop forms.
+    """
+    fields = PdfReader(pdf_path).get_fields()
+    if not fields:
+        return None
+    if field_map is None:
+        field_map = load_field_map()
+
+    caci_forms = []
+    seen = set()
+    unmapped = []
+    for name, field in fields.items():
+        if field.get("/FT") != "/Btn" or field.get("/V") in UNCHECKED:
+            continue
+        caci_number = caci_number_for_field(name, field, field_map)
+        if caci_number is None:
+            unmapped.append(name)
+            continue
+        if caci_number in seen:
+            continue
+        seen.add(caci_number)
+        caci_forms.append({
+            "CACI Number": caci_number,
+            "Jury Instructions": CACI_TITLES.get(caci_number) or str(field.get("/TU") or name),
+        })
+    if unmapped:
+        print(f"Checked LA CIV 244 fields with no known CACI number (add them to {FIELD_MAP_PATH}): "
+              f"{', '.join(unmapped)}")
+        return None
+    return caci_forms
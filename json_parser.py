@@ -0,0 +1,93 @@
+import json
+import re
+
+# The only characters that change the parser state; everything else is skipped over
+_STRUCTURAL = re.compile(r'[{}\[\]"\\]')
+_TRAILING_COMMA = re.compile(r',(\s*[}\]])')
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def _loads(span):
+    """json.loads with a repair pass for trailing commas; None if still invalid"""
+    try:
+        return json.loads(span)
+    except json.JSONDecodeError:
+        pass
+    try:
+        return json.loads(_TRAILING_COMMA.sub(r'\1', span))
+    except json.JSONDecodeError:
+        return None
+
+
+def iter_json_values(text):
+    """Yield every top-level JSON object or array found in `text`
+
+    The text is scanned once, jumping between structural characters, so code
+    fences, prose around the JSON and several concatenated objects are all
+    handled without re-parsing. A value cut off at the end of the text (e.g.
+    a reply that hit the output token limit) is closed and parsed if possible.
+    """
+    stack = []
+    start = None
+    in_string = False
+    skip_to = -1
+
+    for match in _STRUCTURAL.finditer(text):
+        pos = match.start()
+        if pos < skip_to:
+            continue
+        ch = match.group()
+
+        if in_string:
+            if ch == "\\":
+                skip_to = pos + 2
+            elif ch == '"':
+                in_string = False
+            continue
+
+        if ch == '"':
+            # Quotes only matter inside a JSON value, not in the surrounding prose
+            in_string = bool(stack)
+        elif ch in _CLOSERS:
+            if not stack:
+                start = pos
+            stack.append(_CLOSERS[ch])
+        elif ch in "}]" and stack:
+            stack.pop()
+            if not stack:
+                value = _loads(text[start:pos + 1])
+                if value is not None:
+                    yield value
+
+    if stack:
+        # Truncated output: close the open string and brackets and try once more
+        tail = text[start:].rstrip().rstrip(",")
+        if in_string:
+            tail += '"'
+        value = _loads(tail + "".join(reversed(stack)))
+        if value is not None:
+            yield value
+
+
+def extract_json_objects(text):
+    """Extract the JSON objects of a model reply as one flat list
+
+    Objects may be wrapped in code blocks, in a JSON array, or simply
+    concatenated. Anything that is not an object (e.g. the "[1]" of a
+    footnote in the surrounding prose) is left out.
+    """
+    objects = []
+    for value in iter_json_values(text):
+        values = value if isinstance(value, list) else [value]
+        objects.extend(item for item in values if isinstance(item, dict))
+    if not objects:
+        raise ValueError("No JSON found.")
+    return objects
+
+
+def extract_json_object(text):
+    """The first JSON object in a model reply"""
+    for value in iter_json_values(text):
+        if isinstance(value, dict):
+            return value
+    raise ValueError("No JSON object found.")
@@ -1,19 +1,31 @@
-from docx import Document
 from docx.shared import RGBColor, Pt
-import json
-import re
 import shutil
 import pathlib
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 from google import genai
 from google.genai import types
 
+from case_cache import get_case_info
+from template_uploads import get_template_file, is_missing_file_error, reupload_template_file
+from blueprint_store import load_blueprint, to_template_data, blueprint_text_path, form_slice, expand_form, COMPACT_FORMAT_NOTE
+from case_facts import extract_case_facts, local_fill, fill_placeholders, form_placeholders, resolve_with_model
+from json_parser import extract_json_objects
+from structured_output import json_config, FORM_SCHEMA, COMPACT_FORM_SCHEMA, CACI_FORMS_SCHEMA
+from form_identification import identify_caci_forms
+from rag_system import CACI_REFERENCE_PDF, RETRIEVAL_K, open_retriever, form_context
+from context_cache import open_shared_context, SHARED_CASE_INFO
+from docx_renderer import DocxBuilder, load_template_body, init_fragment_worker, render_form_xml
+
 # Set up the API key and client
 api_key = "ADD API KEY"
 client = genai.Client(api_key=api_key)
 
-def analyze_pdf_with_gemini(pdf_path, prompt_text, api_key):
-    """Send PDF to Gemini and get analysis results"""
+def analyze_pdf_with_gemini(pdf_path, prompt_text, api_key, config=None):
+    """Send PDF to Gemini and get analysis results (`config`, e.g. a json_config, is passed through)"""
     client = genai.Client(api_key=api_key)
     filepath = pathlib.Path(pdf_path)
     
@@ -25,71 +37,19 @@ def analyze_pdf_with_gemini(pdf_path, prompt_text, api_key):
                 mime_type='application/pdf',
             ),
             prompt_text
-        ]
+        ],
+        config=config
     )
     
     return response.text
 
 def analyze_template(template_path):
-    """Analyze Word template to identify placeholders and styles"""
-    doc = Document(template_path)
-    template_data = []
-    
-    for para in doc.paragraphs:
-        para_info = {
-            "style": para.style.name,
-            "runs": [],
-            "placeholders": []
-        }
-        
-        for run in para.runs:
-            # Capture formatting
-            fmt = {
-                "text": run.text,
-                "bold": run.bold,
-                "italic": run.italic,
-                "color": run.font.color.rgb if run.font.color and run.font.color.rgb else None
-            }
-            para_info["runs"].append(fmt)
-            
-            # Identify placeholders
-            if '#' in run.text and run.font.color and run.font.color.rgb == RGBColor(0xFF, 0, 0):
-                para_info["placeholders"].append({
-                    "placeholder": run.text.strip(),
-                    "position": len(para_info["runs"])-1
-                })
-                
-        template_data.append(para_info)
-    
-    with open("template_blueprint.json", "w") as f:
-        json.dump(template_data, f, indent=2)
-    
-    return template_data
+    """Analyze Word template to identify placeholders and styles
 
-def extract_json_objects(text):
-    """Extract JSON objects from text that may be wrapped in code blocks"""
-    match = re.search(r'```json\s*(.*?)\s*```', text, re.DOTALL)
-    if match:
-        json_block = match.group(1)
-    else:
-        match = re.search(r'```\s*(.*?)\s*```', text, re.DOTALL)
-        if match:
-            json_block = match.group(1)
-        else:
-            json_block = text.strip()
-    
-    json_block = re.sub(r'\}\s*,?\s*\{', '},{', json_block)
-    if not json_block.startswith('['):
-        json_block = f"[{json_block}]"
-    if not json_block.endswith(']'):
-        json_block = f"{json_block}]"
-    
-    try:
-        parsed = json.loads(json_block)
-    except json.JSONDecodeError as e:
-        raise ValueError(f"Invalid JSON: {e}")
-
-    return parsed
+    The template is only parsed when it changed since the last compile;
+    otherwise the stored blueprint is loaded.
+    """
+    return to_template_data(load_blueprint(template_path))
 
 def color_from_hex(hexstr):
     """Convert various color formats to RGBColor"""
@@ -105,41 +65,46 @@ def color_from_hex(hexstr):
             return RGBColor(int(hexstr[0:2], 16), int(hexstr[2:4], 16), int(hexstr[4:6], 16))
     return None
 
-def generate_content(caci_forms):
-    """Generate content for multiple CACI forms and combine them into one document"""
-    api_key = "ADD API KEY"
-    client = genai.Client(api_key=api_key)
-    
-    # Get the case information from the PDF
-    filepath = pathlib.Path("UD 105 Path")
-    prompt = 'Give me all information you have about the case'
-    response = client.models.generate_content(
-        model="gemini-2.0-flash-exp",
-        contents=[
-            types.Part.from_bytes(
-                data=filepath.read_bytes(),
-                mime_type='application/pdf',
-            ),
-            prompt
-        ]
-    )
-    cont = response.text
-    
-    # Upload the template structure
-    myfile = client.files.upload(file="Template txt file; output.txt")
-    
-    # Create a new document to hold all forms
-    combined_doc = Document()
-    
-    # Process each form identified from the LA CIV 244
-    for i, form in enumerate(caci_forms):
-        caci_number = form["CACI Number"]
-        jury_instructions = form["Jury Instructions"]
-        
-        print(f"Processing {i+1}/{len(caci_forms)}: CACI {caci_number} - {jury_instructions}")
-        
-        # Build prompt with formatting context for each form
-        prompt = f"""Legal Document Generation Task:
+class RateLimiter:
+    """Space out API calls so that at most `rate` of them start per second"""
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+# Example paragraph shown to the model for compact blueprint templates
+COMPACT_FORMAT_HINT = f"""{COMPACT_FORMAT_NOTE}
+        "format": 0,
+        "runs": [
+          
+            "text": "",
+            "format": 0
+          
+        ],
+        Output:"""
+
+def build_form_prompt(caci_number, jury_instructions, cont, compact=False):
+    """Build the fill prompt for a single CACI form
+
+    With `compact` the template is the blueprint's compact text and the
+    reply keeps its format ids instead of spelling out each run's styling.
+    """
+    if compact:
+        return f"""Legal Document Generation Task:
+        Fill in the CACI template for this given CACI form using the provided context: "CACI Number": "{caci_number}", "Jury Instructions": "{jury_instructions}". Use this as context: {cont} to fill the form placeholders. Use the context and fill in placeholder such as defendant/plaintiff/city/address. Make your best guess for the placeholders. I want to see all placeholders filled. Dont output anything else. Keep the output in the same format as the input. JSON format, with the same attributes as the provided doc, you only need to change the text as you see fit.
+        Fill the entire CACI form. I need the entire form, with all placeholders filled in, one entry per template paragraph (not the formats line).
+        {COMPACT_FORMAT_HINT}"""
+    return f"""Legal Document Generation Task:
         Fill in the CACI template for this given CACI form using the provided context: "CACI Number": "{caci_number}", "Jury Instructions": "{jury_instructions}". Use this as context: {cont} to fill the form placeholders. Use the context and fill in placeholder such as defendant/plaintiff/city/address. Make your best guess for the placeholders. I want to see all placeholders filled. Dont output anything else. Keep the output in the same format as the input. JSON format, with the same attributes as the provided doc, you only need to change the text as you see fit.
         Use the same attributes as the provided text with the same styling. I need the same format as input. JSON format with the style, run, text, everything in style formatting. Fill the entire CACI form. I need the entire form, with all placeholders filled in.
         Ignore any lines of this form 
@@ -155,108 +120,331 @@ def generate_content(caci_forms):
         "placeholders": []
       ,
         Output:"""
-        
-        response = client.models.generate_content(
-                model="gemini-2.0-flash-exp",
-                contents=[
-                    prompt, myfile
-                ]
-        )
-        
-        result_text = response.text
-        
-        # Extract JSON data
+
+def fill_form(client, form, cont, template, rate_limiter=None, shared=None, compact=False):
+    """Ask Gemini to fill one CACI form and return the raw response text
+
+    `template` is either the uploaded master template file, the text of
+    just this form's paragraphs, or None when the template is part of the
+    `shared` job context. `compact` templates come from a blueprint and
+    are answered in COMPACT_FORM_SCHEMA.
+    """
+    prompt = build_form_prompt(form["CACI Number"], form["Jury Instructions"], cont, compact)
+    contents = [prompt] if template is None else [prompt, template]
+    config = json_config(COMPACT_FORM_SCHEMA if compact else FORM_SCHEMA)
+    if rate_limiter:
+        rate_limiter.wait()
+    if shared is not None:
+        return shared.generate(client, contents, config=config).text
+    response = client.models.generate_content(
+            model="gemini-2.0-flash-exp",
+            contents=contents,
+            config=config
+    )
+    return response.text
+
+def add_form_to_document(combined_doc, caci_number, jury_instructions, form_data):
+    """Append a title and the filled paragraphs of one form to the document"""
+    # Fix style capitalization if needed (the model tends to write "normal"; template names are kept as is)
+    for item in form_data:
+        if "style" in item and isinstance(item["style"], str) and item["style"].islower():
+            item["style"] = item["style"].capitalize()
+    
+    # Add form title to the combined document
+    title_para = combined_doc.add_paragraph()
+    title_run = title_para.add_run(f"CACI {caci_number}: {jury_instructions}")
+    title_run.bold = True
+    title_run.font.size = Pt(14)
+    
+    # Add form content
+    for para in form_data:
+        new_para = combined_doc.add_paragraph(style=para.get("style", "Normal"))
+        for run_info in para["runs"]:
+            run = new_para.add_run(run_info["text"])
+            run.bold = run_info.get("bold", False)
+            run.italic = run_info.get("italic", False)
+            if "color" in run_info and run_info["color"]:
+                run.font.color.rgb = color_from_hex(run_info["color"])
+
+def generate_content(caci_forms, case_pdf_path="UD 105 Path", template_txt_path="Template txt file; output.txt",
+                     blueprint=None, max_workers=4, rate_limit=None, caci_pdf_path=CACI_REFERENCE_PDF,
+                     retrieval_k=RETRIEVAL_K, output_path="final_output.docx", rate_limiter=None,
+                     template_path=None, render_workers=1, render_pool=None, caci_retriever=None):
+    """Generate content for multiple CACI forms and combine them into one document
+
+    The per-form fill requests are issued concurrently (at most `max_workers` in
+    flight, at most `rate_limit` started per second) and the results are
+    assembled in the original LA CIV 244 order. `max_workers=1` processes the
+    forms one after another. Several jobs can share one `rate_limiter` so
+    all their Gemini calls (fills, fact extraction, uploads, context caches
+    and retrieval embeddings) together stay under a single API rate.
+
+    When a compiled `blueprint` is given, placeholders are filled locally
+    from case facts extracted once per case, and the model is only asked for
+    the placeholders the facts could not answer (all of them, if the facts
+    cannot be extracted). It replies with {placeholder_id: value} pairs that
+    are merged into the form's template slice here, instead of echoing every
+    paragraph and run. Forms missing from the blueprint's index fall back to
+    the uploaded master template and a full-form reply.
+
+    Instead of the whole case summary, each prompt carries the `retrieval_k`
+    case-file and CACI reference passages most relevant to its form, so the
+    prompt size stays bounded however long the case file is. `retrieval_k=0`,
+    or a case file without a text layer, falls back to the full summary.
+    Jobs running side by side should share one `caci_retriever` (see
+    open_retriever) instead of each opening the CACI reference index.
+
+    Whatever every call would repeat (the full case summary, and the master
+    template when no form has a slice of its own) is registered once per
+    job as a Gemini context cache and referenced from each call.
+
+    With the blueprint's source `template_path` (.docx), the output is a copy
+    of the template package: locally filled forms are copied from the
+    template body with only their placeholder runs patched, so styles,
+    numbering, tables, headers and section layout are kept.
+
+    Forms are rendered in-process by default: starting a spawned pool costs
+    far more than rendering a packet with DocxBuilder. With
+    `render_workers` > 1, or a `render_pool` from open_render_pool (reused
+    across jobs of the same template), each form is rendered to its own
+    body fragment in the pool as soon as its fill completes, and the
+    fragments are merged in LA CIV 244 order.
+    """
+    api_key = "ADD API KEY"
+    client = genai.Client(api_key=api_key)
+    # Every Gemini call of the job (uploads, caches and embeddings included) takes a slot of the limiter
+    if rate_limiter is None:
+        rate_limiter = RateLimiter(rate_limit)
+    
+    # Structured case facts let most placeholders be filled locally, without a call per form
+    facts = None
+    if blueprint:
         try:
-            form_data = extract_json_objects(result_text)
-            
-            # Fix style capitalization if needed
-            for item in form_data:
-                if "style" in item and isinstance(item["style"], str):
-                    item["style"] = item["style"].capitalize()
-            
-            # Add form title to the combined document
-            title_para = combined_doc.add_paragraph()
-            title_run = title_para.add_run(f"CACI {caci_number}: {jury_instructions}")
-            title_run.bold = True
-            title_run.font.size = Pt(14)
-            
-            # Add form content
-            for para in form_data:
-                new_para = combined_doc.add_paragraph(style=para.get("style", "Normal"))
-                for run_info in para["runs"]:
-                    run = new_para.add_run(run_info["text"])
-                    run.bold = run_info.get("bold", False)
-                    run.italic = run_info.get("italic", False)
-                    if "color" in run_info and run_info["color"]:
-                        run.font.color.rgb = color_from_hex(run_info["color"])
-            
-            # Add page break after each form (except the last one)
-            if i < len(caci_forms) - 1:
-                combined_doc.add_page_break()
-                
-            print(f'✓ Added CACI {caci_number}')
-            
+            facts = extract_case_facts(client, case_pdf_path, rate_limiter)
+            print(f"Extracted {len(facts)} case facts")
+        except Exception as e:
+            print(f"Could not extract case facts, filling forms with the model: {str(e)}")
+    
+    # Plan each form: fill its template slice locally (asking the model only for placeholder values),
+    # or have the model echo the whole form from the master template
+    plans = []
+    for form in caci_forms:
+        paragraphs = form_slice(blueprint, form["CACI Number"]) if blueprint else None
+        if paragraphs:
+            values, unresolved = local_fill(paragraphs, facts or {})
+            plans.append(("local", paragraphs, values, unresolved))
+        else:
+            plans.append(("model", None))
+    
+    needs_context = any(plan[0] == "model" or plan[3] for plan in plans)
+    
+    # Index the case file and the CACI reference text for per-form retrieval
+    case_retriever = None
+    if needs_context and retrieval_k:
+        try:
+            case_retriever = open_retriever(case_pdf_path, api_key=api_key, rate_limiter=rate_limiter)
+            if case_retriever is not None and caci_retriever is None:
+                caci_retriever = open_retriever(caci_pdf_path, api_key=api_key, rate_limiter=rate_limiter)
+        except Exception as e:
+            print(f"Could not index the case file, using the full case summary: {str(e)}")
+            case_retriever = None
+    
+    # The free-text case summary is only needed for what the facts could not fill
+    cont = None
+    if needs_context and case_retriever is None:
+        # Get the case information from the PDF (reused from the cache when the same PDF was seen before)
+        cont, cached = get_case_info(client, case_pdf_path, rate_limiter=rate_limiter)
+        if cached:
+            print("Using cached case information")
+    
+    myfile = None
+    if any(plan == ("model", None) for plan in plans):
+        # Upload the template structure (reused while the previous upload is still valid)
+        myfile = get_template_file(client, template_txt_path, rate_limiter=rate_limiter)
+    
+    # Register what every call would otherwise repeat once, as a cached context
+    shared = None
+    shared_contents = []
+    if cont is not None:
+        shared_contents.append(f"Case information:\n{cont}")
+    share_template = myfile is not None and all(plan[0] == "model" for plan in plans)
+    if share_template:
+        shared_contents.append(myfile)
+    if shared_contents:
+        shared = open_shared_context(client, shared_contents, rate_limiter=rate_limiter)
+    
+    def context_for(form, terms=()):
+        if case_retriever is None:
+            return SHARED_CASE_INFO if shared is not None else cont
+        return form_context(form["CACI Number"], form["Jury Instructions"], case_retriever, caci_retriever,
+                            k=retrieval_k, terms=terms)
+    
+    def complete_form(form, plan):
+        if plan[0] == "model":
+            template = None if share_template else myfile
+            try:
+                reply = fill_form(client, form, context_for(form), template, rate_limiter, shared, compact=blueprint is not None)
+            except Exception as e:
+                if not is_missing_file_error(e):
+                    raise
+                print(f"Uploaded template {myfile.name} is no longer available, uploading it again")
+                fresh = reupload_template_file(client, template_txt_path, myfile, rate_limiter=rate_limiter)
+                # The shared context may hold the stale handle, so the case context and template go inline
+                context = cont if case_retriever is None else context_for(form)
+                reply = fill_form(client, form, context, fresh, rate_limiter, compact=blueprint is not None)
+            if blueprint is not None:
+                return expand_form(extract_json_objects(reply), blueprint)
+            return extract_json_objects(reply)
+        _, paragraphs, values, unresolved = plan
+        if unresolved:
+            context = context_for(form, unresolved)
+            # Only the case summary is of use here, not a shared master template
+            summary = shared if cont is not None else None
+            placeholders = form_placeholders(paragraphs, unresolved)
+            values = {**values, **resolve_with_model(client, form["CACI Number"], placeholders, context, rate_limiter, summary)}
+        if template_body is not None:
+            return values
+        return fill_placeholders(paragraphs, values)
+    
+    def complete_and_render(form, plan):
+        form_data = complete_form(form, plan)
+        if render_pool is None:
+            return form_data
+        from_template = plan[0] == "local" and template_body is not None
+        return render_pool.submit(render_form_xml, form["CACI Number"], form["Jury Instructions"], form_data,
+                                  from_template).result()
+    
+    # Create a new document to hold all forms (written straight to WordprocessingML)
+    template_body = None
+    if template_path and blueprint:
+        try:
+            template_body = load_template_body(template_path, blueprint)
         except Exception as e:
-            print(f"✗ Error processing CACI {caci_number}: {str(e)}")
-            # Add error note to document
-            error_para = combined_doc.add_paragraph()
-            error_run = error_para.add_run(f"Error processing CACI {caci_number}: {str(e)}")
-            error_run.font.color.rgb = RGBColor(255, 0, 0)
+            print(f"Could not reuse the template package, rendering forms from scratch: {str(e)}")
+    combined_doc = template_body.builder() if template_body is not None else DocxBuilder()
+    
+    own_pool = None
+    if render_pool is None and render_workers > 1:
+        render_pool = own_pool = open_render_pool(render_workers, template_path, blueprint)
+    
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            # Issue every fill up front; the pool bounds how many model calls are in flight
+            futures = [
+                pool.submit(complete_and_render, form, plan)
+                for form, plan in zip(caci_forms, plans)
+            ]
             
-            # Add page break after error (except if it's the last form)
-            if i < len(caci_forms) - 1:
-                combined_doc.add_page_break()
+            # Assemble the results in LA CIV 244 order as they become available
+            for i, (form, plan, future) in enumerate(zip(caci_forms, plans, futures)):
+                caci_number = form["CACI Number"]
+                jury_instructions = form["Jury Instructions"]
+                
+                print(f"Processing {i+1}/{len(caci_forms)}: CACI {caci_number} - {jury_instructions}")
+                
+                try:
+                    form_data = future.result()
+                    if render_pool is not None:
+                        combined_doc.add_xml(form_data)
+                    elif plan[0] == "local" and template_body is not None:
+                        combined_doc.add_xml(template_body.form_xml(caci_number, form_data))
+                    else:
+                        combined_doc.add_form(caci_number, jury_instructions, form_data)
+                    print(f'✓ Added CACI {caci_number}')
+                    
+                except Exception as e:
+                    print(f"✗ Error processing CACI {caci_number}: {str(e)}")
+                    # Add error note to document
+                    combined_doc.add_error(f"Error processing CACI {caci_number}: {str(e)}")
+                
+                # Add page break after each form (except the last one)
+                if i < len(caci_forms) - 1:
+                    combined_doc.add_page_break()
+    finally:
+        if own_pool is not None:
+            own_pool.shutdown()
+        if shared is not None:
+            shared.close(client)
     
     # Save the combined document
-    output_path = "final_output.docx"
     combined_doc.save(output_path)
     print(f"\nAll forms combined into {output_path}")
     
     return output_path
 
+def open_render_pool(workers, template_path=None, blueprint=None):
+    """A process pool rendering form fragments for generate_content(render_pool=...)
+
+    Each worker builds its DocxBuilder, and the template body when
+    `template_path` and `blueprint` are given, once; the pool can be reused
+    by every job on the same template and must be shut down by the caller.
+    """
+    template_body = None
+    if template_path and blueprint:
+        try:
+            template_body = load_template_body(template_path, blueprint)
+        except Exception as e:
+            print(f"Could not reuse the template package, rendering forms from scratch: {str(e)}")
+    layout = template_body.layout if template_body is not None else DocxBuilder().layout
+    # Spawned rather than forked: the fill threads may be holding locks when a worker starts
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_fragment_worker,
+        initargs=(layout,) + ((template_path, blueprint) if template_body is not None else ()),
+    )
+
+def identify_forms(pd_path, api_key, rate_limiter=None):
+    """CACI forms checked on an LA CIV 244, from its form fields or, for a flattened PDF, from Gemini
+
+    The Gemini call waits for a slot of `rate_limiter`, when given.
+
+    Raises ValueError (after printing the raw reply) when Gemini's answer holds no form records.
+    """
+    caci_forms = identify_caci_forms(pd_path)
+    if caci_forms:
+        return caci_forms
+    print("No checked CACI fields found in the LA CIV 244 form fields; asking Gemini")
+    prompt = f"""Analyse the given LA CIV 244 submission and then identify all the forms that need to be filled based on whatever defenses/forms
+    are ticked/checked in the LA CIV. Then return your output in json format, with each record having two keys, the keys being CACI Number and Jury Instructions. Make sure every form that is checked/ticked is included. I need no other output."""
+    
+    if rate_limiter:
+        rate_limiter.wait()
+    result = analyze_pdf_with_gemini(pd_path, prompt, api_key, config=json_config(CACI_FORMS_SCHEMA))
+    try:
+        caci_forms = [form for form in extract_json_objects(result) if form.get("CACI Number")]
+        if not caci_forms:
+            raise ValueError("No CACI forms found in the reply.")
+        return caci_forms
+    except ValueError:
+        print("Raw output:")
+        print(result)
+        raise
+
 def main():
     # Set up templates and directories
     template_path = "Master LAFLA Template"
-    template_data = analyze_template(template_path)
+    blueprint = load_blueprint(template_path)
     
-    # Save template data to a file for reference by the Gemini model
-    with open("output.txt", "w", encoding="utf-8") as out:
-        for para in template_data:
-            out.write(json.dumps(para, ensure_ascii=False))  # Converts dict to string
-            out.write("\n")  # Newline after each paragraph
+    # The blueprint store keeps a text copy of the template for the Gemini model
+    template_txt_path = blueprint_text_path(blueprint)
     
-    # Identify forms that need to be filled
-    api_key = "ADD API KEY"
+    # Identify forms that need to be filled, straight from the checkboxes when the PDF still has its form fields
     pd_path = "LA CIV PDF"
-    prompt = f"""Analyse the given LA CIV 244 submission and then identify all the forms that need to be filled based on whatever defenses/forms
-    are ticked/checked in the LA CIV. Then return your output in json format, with each record having two keys, the keys being CACI Number and Jury Instructions. Make sure every form that is checked/ticked is included. I need no other output."""
-    
-    result = analyze_pdf_with_gemini(pd_path, prompt, api_key)
-    
-    # Extract JSON from result
-    if "```json" in result:
-        # Extract content between ```json and the last ```
-        json_text = result.split("```json")[1].split("```")[0].strip()
-    elif "```" in result:
-        # Extract content between first ``` and the last ```
-        json_text = result.split("```")[1].split("```")[0].strip()
-    else:
-        json_text = result.strip()
+    api_key = "ADD API KEY"
     
-    # Parse JSON to get list of forms to process
     try:
-        caci_forms = json.loads(json_text)
+        caci_forms = identify_forms(pd_path, api_key)
         print(f"Found {len(caci_forms)} CACI forms to process:")
         for form in caci_forms:
             print(f"- CACI {form['CACI Number']}: {form['Jury Instructions']}")
         
         # Process all forms and create a single combined document
-        output_file = generate_content(caci_forms)
+        output_file = generate_content(caci_forms, template_txt_path=template_txt_path, blueprint=blueprint,
+                                       template_path=template_path)
         print(f"\nProcessing complete. All forms have been combined into {output_file}")
-    except json.JSONDecodeError as e:
+    except ValueError as e:
         print(f"Invalid JSON: {str(e)}")
-        print("Raw output:")
-        print(result)
     except Exception as e:
         print(f"Error during processing: {str(e)}")
 
@@ -1,50 +1,370 @@
-import google.generativeai as genai
-from langchain.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
 import google.generativeai as genai
 import google.auth
 from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-import google.generativeai as genai
+
+from text_extraction import form_field_pages
+
+EMBEDDING_MODEL = "models/text-embedding-004"
+
+# The CACI reference text the form passages are retrieved from
+CACI_REFERENCE_PDF = "Template PDF; relevant.pdf"
+
+# Passages retrieved per source for each form prompt
+RETRIEVAL_K = 5
+
+# batchEmbedContents accepts at most 100 texts per call
+EMBED_BATCH_SIZE = 100
+
+# One lock per index directory, so concurrent jobs build a shared index once
+_index_locks = {}
+_index_locks_lock = threading.Lock()
+
+
+def index_lock(index_dir):
+    with _index_locks_lock:
+        return _index_locks.setdefault(os.path.abspath(index_dir), threading.Lock())
+
+
+def _tmp_path(path):
+    """A temporary file name next to `path`, unique per process and thread"""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def embed_texts(texts, task_type="retrieval_document", batch_size=EMBED_BATCH_SIZE, rate_limiter=None):
+    """Embed texts in batches and return an L2-normalized float32 matrix (one row per text)
+
+    Each batch call waits for a slot of `rate_limiter`, when given.
+    """
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        if rate_limiter:
+            rate_limiter.wait()
+        result = genai.embed_content(
+            model=EMBEDDING_MODEL,
+            content=texts[start:start + batch_size],
+            task_type=task_type,
+        )
+        vectors.extend(result["embedding"])
+    return normalize(np.asarray(vectors, dtype=np.float32))
+
+
+def fingerprint(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_fingerprint(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def exact_search(matrix, query_vector, k):
+    """Row ids of the `k` rows with the highest dot product with `query_vector`, best first"""
+    scores = matrix @ query_vector
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+class IVFIndex:
+    """Inverted-file approximate nearest neighbour index over normalized vectors
+
+    The vectors are clustered with spherical k-means into `n_lists` lists; a
+    query is only compared with the vectors of its `nprobe` closest lists.
+    """
+    def __init__(self, centroids, order, offsets):
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+
+    @classmethod
+    def build(cls, matrix, n_lists=None, iterations=10, sample_size=50000, seed=0):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        n = len(matrix)
+        n_lists = max(1, min(n_lists or int(np.sqrt(n)), n))
+        rng = np.random.default_rng(seed)
+
+        # Train the centroids on a sample, then assign every vector to its closest list
+        sample = matrix[rng.choice(n, size=min(n, sample_size), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]
+            centroids = normalize(sums)
+
+        assignment = np.argmax(matrix @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        offsets = np.searchsorted(assignment[order], np.arange(n_lists + 1))
+        return cls(centroids, order, offsets)
+
+    def search(self, matrix, query_vector, k, nprobe=8):
+        """Approximate top-`k` row ids of `matrix` for `query_vector`, best first"""
+        nprobe = min(nprobe, len(self.centroids))
+        lists = np.argpartition(-(self.centroids @ query_vector), nprobe - 1)[:nprobe]
+        candidates = np.concatenate([self.order[self.offsets[i]:self.offsets[i + 1]] for i in lists])
+        return candidates[exact_search(matrix[candidates], query_vector, k)]
+
+    def save(self, path, **meta):
+        np.savez(path, centroids=self.centroids, order=self.order, offsets=self.offsets, **meta)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data["centroids"], data["order"], data["offsets"]), data
+
+
 class DocumentRetriever:
-    def __init__(self, pdf_path: str):
+    def __init__(self, pdf_path: str, index_dir: str = None, api_key: str = None,
+                 index: str = "exact", n_lists: int = None, nprobe: int = 8, rate_limiter=None):
+        """`index` is "exact" for brute-force search or "ivf" for the approximate IVF index
+
+        Embedding calls wait for a slot of `rate_limiter` (shared with the
+        other Gemini calls of a job), when given.
+        """
         self.pdf_path = pdf_path
-        credentials, project = google.auth.default()
-        self.model = genai.GenerativeModel('text-embedding-004')
-        genai.configure(api_key=None, credentials=credentials)
+        self.index_dir = index_dir or f"{os.path.splitext(pdf_path)[0]}_index"
+        self.index = index
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.ivf = None
+        self.rate_limiter = rate_limiter
+        if api_key:
+            genai.configure(api_key=api_key)
+        else:
+            credentials, project = google.auth.default()
+            genai.configure(api_key=None, credentials=credentials)
         self.chunks = []
-        self.embeddings = []
-        
+        self.embeddings = np.zeros((0, 0), dtype=np.float32)
+
+    @property
+    def embeddings_path(self):
+        return os.path.join(self.index_dir, "embeddings.npy")
+
+    @property
+    def chunks_path(self):
+        return os.path.join(self.index_dir, "chunks.json")
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.index_dir, "manifest.json")
+
     def process_document(self):
-        # Load and split document
+        """Build or update the index, embedding only chunks that are not already stored
+
+        An unchanged PDF is loaded straight from disk. Otherwise only pages
+        whose text changed are re-split, and only chunks whose text is new are
+        embedded; every other chunk keeps its stored embedding. Concurrent
+        calls for the same index directory in this process run one at a time,
+        so a shared index (e.g. the CACI reference) is only embedded once.
+        """
+        with index_lock(self.index_dir):
+            self._update_index()
+
+    def _update_index(self):
+        pdf_fingerprint = file_fingerprint(self.pdf_path)
+        manifest = self._read_manifest()
+        if manifest.get("pdf") == pdf_fingerprint and manifest.get("model") == EMBEDDING_MODEL and self.load():
+            return
+
+        # Stored chunks and embeddings, reusable when the embedding model is the same.
+        # Pages with identical text (e.g. blank pages) share one chunk list, taken from the first of them
+        old_chunks_by_page = {}
+        old_rows = {}
+        if manifest.get("model") == EMBEDDING_MODEL and self.load():
+            first_pages = {}
+            for row, chunk in enumerate(self.chunks):
+                if first_pages.setdefault(chunk["page_hash"], chunk["page"]) == chunk["page"]:
+                    old_chunks_by_page.setdefault(chunk["page_hash"], []).append(chunk)
+                old_rows.setdefault(chunk["hash"], row)
+        old_embeddings = self.embeddings
+
+        # Load document and split only the pages that changed
         loader = PyPDFLoader(self.pdf_path)
         pages = loader.load()
-        
+
+        # The text layer of a fillable form (e.g. a UD-105) holds only its boilerplate;
+        # the typed-in names, addresses and dates are form field values
+        field_pages = form_field_pages(self.pdf_path)
+        for page_num, page in enumerate(pages, start=1):
+            if page_num in field_pages:
+                page.page_content = f"{page.page_content}\n{field_pages[page_num]}"
+
         splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,
             chunk_overlap=200
         )
-        self.chunks = splitter.split_documents(pages)
-        
-        # Generate embeddings for all chunks using the correct method
-        for chunk in self.chunks:
-            result = self.model.cached_content(chunk.page_content)
-            self.embeddings.append(result.embeddings)
-
-retriever = DocumentRetriever(
-    pdf_path="Template PDF; relevant.pdf"
-)
-
-# Process the document
-retriever.process_document()
-
-# Get relevant chunks
-chunks = retriever.get_relevant_chunks(
-    query="4329. Affirmative Defense—Failure to Provide Reasonable Accommodation",
-    k=5
-)
-
-# Print results
-for i, chunk in enumerate(chunks, 1):
-    print(f"\nChunk {i}:")
-    print(chunk)
+        chunks = []
+        for page in pages:
+            page_hash = fingerprint(page.page_content)
+            page_number = page.metadata.get("page")
+            if page_hash in old_chunks_by_page:
+                chunks.extend(dict(chunk, page=page_number) for chunk in old_chunks_by_page[page_hash])
+                continue
+            for doc in splitter.split_documents([page]):
+                chunks.append({
+                    "text": doc.page_content,
+                    "page": page_number,
+                    "hash": fingerprint(doc.page_content),
+                    "page_hash": page_hash,
+                })
+
+        # Embed the new chunks in batched calls and reuse the stored rows for the rest
+        new_texts = list({chunk["hash"]: chunk["text"] for chunk in chunks if chunk["hash"] not in old_rows}.items())
+        new_vectors = embed_texts([text for _, text in new_texts], rate_limiter=self.rate_limiter)
+        new_rows = {chunk_hash: row for row, (chunk_hash, _) in enumerate(new_texts)}
+        reused = sum(chunk["hash"] in old_rows for chunk in chunks)
+        print(f"Embedded {len(new_texts)} new chunks, reused {reused} stored embeddings")
+
+        if chunks:
+            self.embeddings = np.stack([
+                new_vectors[new_rows[chunk["hash"]]] if chunk["hash"] in new_rows
+                else old_embeddings[old_rows[chunk["hash"]]]
+                for chunk in chunks
+            ]).astype(np.float32)
+        else:
+            self.embeddings = np.zeros((0, 0), dtype=np.float32)
+        self.chunks = chunks
+        self.ivf = None
+        self.save()
+        self._write_manifest({"pdf": pdf_fingerprint, "model": EMBEDDING_MODEL})
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_manifest(self, manifest):
+        tmp_path = _tmp_path(self.manifest_path)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def save(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        # Write to a temporary file first; the old matrix may still be memory-mapped
+        tmp_path = _tmp_path(self.embeddings_path)
+        with open(tmp_path, "wb") as f:
+            np.save(f, self.embeddings)
+        os.replace(tmp_path, self.embeddings_path)
+        tmp_path = _tmp_path(self.chunks_path)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.chunks, f, ensure_ascii=False)
+        os.replace(tmp_path, self.chunks_path)
+
+    def load(self):
+        """Load a persisted index; the embedding matrix is memory-mapped, not read into memory"""
+        if not (os.path.exists(self.embeddings_path) and os.path.exists(self.chunks_path)):
+            return False
+        self.embeddings = np.load(self.embeddings_path, mmap_mode="r")
+        with open(self.chunks_path, "r", encoding="utf-8") as f:
+            self.chunks = json.load(f)
+        return True
+
+    @property
+    def ivf_path(self):
+        return os.path.join(self.index_dir, "ivf.npz")
+
+    def _ivf_index(self):
+        """The IVF index for the current embeddings, loaded from disk or rebuilt when stale"""
+        if self.ivf is not None:
+            return self.ivf
+        with index_lock(self.index_dir):
+            pdf_fingerprint = self._read_manifest().get("pdf", "")
+            if os.path.exists(self.ivf_path):
+                ivf, meta = IVFIndex.load(self.ivf_path)
+                if str(meta["pdf"]) == pdf_fingerprint and int(meta["rows"]) == len(self.embeddings) \
+                        and (self.n_lists is None or len(ivf.centroids) == self.n_lists):
+                    self.ivf = ivf
+                    return ivf
+            ivf = IVFIndex.build(self.embeddings, self.n_lists)
+            os.makedirs(self.index_dir, exist_ok=True)
+            tmp_path = _tmp_path(self.ivf_path)
+            with open(tmp_path, "wb") as f:
+                ivf.save(f, pdf=pdf_fingerprint, rows=len(self.embeddings))
+            os.replace(tmp_path, self.ivf_path)
+            self.ivf = ivf
+            return ivf
+
+    def get_relevant_chunks(self, query: str, k: int = 5):
+        """The `k` chunks most similar to `query` (cosine similarity), best first"""
+        if not len(self.chunks):
+            return []
+        query_vector = embed_texts([query], task_type="retrieval_query", rate_limiter=self.rate_limiter)[0]
+        if self.index == "ivf":
+            top = self._ivf_index().search(self.embeddings, query_vector, k, self.nprobe)
+        else:
+            top = exact_search(self.embeddings, query_vector, k)
+        return [self.chunks[i]["text"] for i in top]
+
+
+def open_retriever(pdf_path, api_key=None, **options):
+    """A DocumentRetriever with its index built or loaded, or None when the PDF is missing or has no text layer"""
+    if not os.path.exists(pdf_path):
+        print(f"No document to retrieve from at {pdf_path}")
+        return None
+    retriever = DocumentRetriever(str(pdf_path), api_key=api_key, **options)
+    retriever.process_document()
+    if not retriever.chunks:
+        print(f"No extractable text in {pdf_path}")
+        return None
+    return retriever
+
+
+def form_context(caci_number, jury_instructions, case_retriever, caci_retriever=None, k=RETRIEVAL_K, terms=()):
+    """The case-file and CACI passages relevant to one form, as prompt context
+
+    The query is the form's number and title plus any extra `terms` (e.g. the
+    placeholders still to fill), so the context stays at most 2 * `k` chunks
+    however long the case file is.
+    """
+    query = " ".join([f"CACI {caci_number}.", jury_instructions, *terms])
+    sections = [("Case file excerpts", case_retriever), ("CACI reference excerpts", caci_retriever)]
+    context = []
+    for label, retriever in sections:
+        if retriever is None:
+            continue
+        passages = retriever.get_relevant_chunks(query, k=k)
+        context.append(f"{label}:\n" + "\n\n".join(f"[{i}] {passage}" for i, passage in enumerate(passages, 1)))
+    return "\n\n".join(context)
+
+
+if __name__ == "__main__":
+    retriever = DocumentRetriever(
+        pdf_path=CACI_REFERENCE_PDF
+    )
+
+    # Process the document (loads the saved index when the PDF is unchanged)
+    retriever.process_document()
+
+    # Get relevant chunks
+    chunks = retriever.get_relevant_chunks(
+        query="4329. Affirmative Defense—Failure to Provide Reasonable Accommodation",
+        k=5
+    )
+
+    # Print results
+    for i, chunk in enumerate(chunks, 1):
+        print(f"\nChunk {i}:")
+        print(chunk)
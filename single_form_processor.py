@@ -3,11 +3,19 @@ from docx.shared import RGBColor
 import json
 
 from google import genai
-from google.genai import types
 import pathlib
 import os
 import PIL
 
+from case_cache import get_case_info
+from template_uploads import call_with_template_file
+from blueprint_store import load_blueprint, blueprint_text_path, form_slice, expand_form, COMPACT_FORMAT_NOTE
+from case_facts import form_placeholders, resolve_with_model, fill_placeholders
+from json_parser import extract_json_objects
+from structured_output import json_config, COMPACT_FORM_SCHEMA
+from rag_system import CACI_REFERENCE_PDF, open_retriever, form_context
+from docx_renderer import load_template_body
+
 
 # Set up the API key and client
 api_key = "ADD API KEY"
@@ -16,121 +24,59 @@ client = genai.Client(api_key=api_key)
 # Replace this with your actual local PDF path
 filepath = pathlib.Path("UD 105 Path")
 
-# Read the local PDF and send it to Gemini
-prompt = 'Give me all information you have about the case'
-response = client.models.generate_content(
-    model="gemini-2.0-flash-exp",
-    contents=[
-        types.Part.from_bytes(
-            data=filepath.read_bytes(),
-            mime_type='application/pdf',
-        ),
-        prompt
-    ]
-)
-
-# Print the result
-cont = response.text
-
-def analyze_template(template_path):
-    
-    doc = Document(template_path)
-    template_data = []
-    
-    for para in doc.paragraphs:
-        para_info = {
-            "style": para.style.name,
-            "runs": [],
-            "placeholders": []
-        }
-        
-        for run in para.runs:
-            # Capture formatting
-            fmt = {
-                "text": run.text,
-                "bold": run.bold,
-                "italic": run.italic,
-                "color": run.font.color.rgb if run.font.color.rgb else None
-            }
-            para_info["runs"].append(fmt)
-            
-            # Identify placeholders
-            if '#' in run.text and run.font.color.rgb == RGBColor(0xFF,0,0):
-                para_info["placeholders"].append({
-                    "placeholder": run.text.strip(),
-                    "position": len(para_info["runs"])-1
-                })
-                
-        template_data.append(para_info)
-    
-    with open("template_blueprint.json", "w") as f:
-        json.dump(template_data, f, indent=2)
-
-
-analyze_template("Template LAFLA Master")
-import json
-with open("template_blueprint.json") as f:
-    data = json.load(f)
+# Only the case-file and CACI passages relevant to CACI 101 go into the prompt
+case_retriever = open_retriever(filepath, api_key=api_key)
+if case_retriever is not None:
+    cont = form_context("101", "Overview of Trial", case_retriever, open_retriever(CACI_REFERENCE_PDF, api_key=api_key))
+else:
+    # No text layer to index: read the local PDF and send it to Gemini (skipped when the same PDF is already cached)
+    cont, _ = get_case_info(client, filepath)
 
-with open("output.txt", "w", encoding="utf-8") as out:
-    for para in data:
-        out.write(json.dumps(para, ensure_ascii=False))  # Converts dict to string
-        out.write("\n")  # Newline after each paragraph
+TEMPLATE_PATH = "Template LAFLA Master"
+blueprint = load_blueprint(TEMPLATE_PATH)
 
 def generate_content():
+    """Fill CACI 101; returns the filled paragraphs and the placeholder values (None for a whole-form reply)"""
     api_key = "ADD API KEY"
     client = genai.Client(api_key=api_key)
-    myfile = client.files.upload(file="template file output.txt")
+    # When the template index has CACI 101, only its placeholder values come back from the model
+    paragraphs = form_slice(blueprint, "101")
+    if paragraphs is not None:
+        placeholders = form_placeholders(paragraphs)
+        values = resolve_with_model(client, "101", placeholders, cont) if placeholders else {}
+        return fill_placeholders(paragraphs, values), values
     # Build prompt with formatting context
     prompt = f"""Legal Document Generation Task:
     Fill in the CACI template for this given CACI form using the provided context: "CACI Number": "101", "Jury Instructions": "Overview of Trial". Use this as context: {cont} to fill the form placeholders. Use the context and fill in placeholder such as defendant/plaintiff/city/address. Make your best guess for the placeholders. I want to see all placeholders filled. Dont output anything else. Keep the output in the same format as the input. JSON format, with the same attributes as the provided doc, you only need to change the text as you see fit.
-    Use the same attributes as the provided text with the same styling. I need the same format as input. JSON format with the style, run, text, everything in style formatting. Fill the entire CACI form.  I need the entire form bro, i dont get what you are not understanding. I only need the CACI 101 form: Overview of a trial. I dont need superflous stuff
+    {COMPACT_FORMAT_NOTE} Fill the entire CACI form.  I need the entire form bro, i dont get what you are not understanding. I only need the CACI 101 form: Overview of a trial. I dont need superflous stuff
     Ignore any lines of this form. I only need the CACI 101. I need everything in one json file, i dont need separate JSON records.
-    "style": "normal",
+    "format": 0,
     "runs": [
       
         "text": "",
-        "bold": null,
-        "italic": null,
-        "color": null
+        "format": 0
       
     ],
-    "placeholders": []
-  ,
     Output:"""
     
-    response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=[
-                prompt, myfile
-            ]
-    )
+    def fill(myfile):
+        return client.models.generate_content(
+                model="gemini-2.0-flash-exp",
+                contents=[
+                    prompt, myfile
+                ],
+                config=json_config(COMPACT_FORM_SCHEMA)
+        )
+    
+    # Uploaded again if Gemini no longer has the previous upload
+    response = call_with_template_file(client, blueprint_text_path(blueprint), fill)
     
-    return response.text
+    return expand_form(get_first_10_records(response.text), blueprint), None
 
 
 import json
 from docx import Document
 from docx.shared import RGBColor
-import shutil
-import re
-
-def extract_json_objects(text):
-    print(text)
-    match = re.search(r'```json\s*(.*?)\s*```', text, re.DOTALL)
-    if not match:
-        raise ValueError("No JSON block found.")
-
-    json_block = match.group(1)
-    json_block = re.sub(r'\}\s*,?\s*\{', '},{', json_block)
-    json_block = f"[{json_block}]"
-
-    try:
-        parsed = json.loads(json_block)
-    except json.JSONDecodeError as e:
-        raise ValueError(f"Invalid JSON: {e}")
-
-    return parsed
 
 def get_first_10_records(text):
     data = extract_json_objects(text)
@@ -144,14 +90,25 @@ def color_from_hex(hexstr):
     hexstr = hexstr.lstrip('#')
     return RGBColor(int(hexstr[0:2], 16), int(hexstr[2:4], 16), int(hexstr[4:6], 16))
 
-def json_to_docx(json_data, docx_path, template_path=None):
+def json_to_docx(json_data, docx_path, template_path=None, values=None):
     if template_path:
-        shutil.copyfile(template_path, docx_path)
-        doc = Document(docx_path)
-        for element in reversed(doc.paragraphs):
-            element.clear()
-    else:
-        doc = Document()
+        # Write into a copy of the template package, keeping its styles, numbering, headers and layout
+        try:
+            template_body = load_template_body(template_path, blueprint)
+        except Exception as e:
+            print(f"Could not reuse the template package, rendering from scratch: {str(e)}")
+            template_body = None
+        if template_body is not None:
+            builder = template_body.builder()
+            form_xml = template_body.form_xml("101", values) if values is not None else None
+            if form_xml is not None:
+                # The template's own CACI 101 body with only the placeholder runs patched
+                builder.add_xml(form_xml)
+            else:
+                builder.add_paragraphs(json_data)
+            builder.save(docx_path)
+            return
+    doc = Document()
 
     for para in json_data:
         new_para = doc.add_paragraph(style=para.get("style", "Normal"))
@@ -165,20 +122,23 @@ def json_to_docx(json_data, docx_path, template_path=None):
 
     doc.save(docx_path)
 try:
-    result = generate_content()
+    result, values = generate_content()
     with open("debug.txt", "w") as file:
-        file.write(str(result))
-    data = get_first_10_records(result)
+        file.write(json.dumps(result, indent=2))
+    data = result
     print(data)
     print("TYPE = ", type(data))
 
     for item in data:
-        if "style" in item and isinstance(item["style"], str):
+        # Only fix all-lowercase names ("normal"); template names like "List Paragraph" are kept as is
+        if "style" in item and isinstance(item["style"], str) and item["style"].islower():
             item["style"] = item["style"].capitalize()
     print(data)    
     json_to_docx(
         data,
         "final_output.docx",
+        TEMPLATE_PATH,
+        values,
     )
     print('DONE')
 
@@ -0,0 +1,85 @@
+from google.genai import types
+
+# Response schemas for Gemini's JSON mode, so replies come back as parseable JSON
+RUN_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "text": {"type": "STRING"},
+        "bold": {"type": "BOOLEAN", "nullable": True},
+        "italic": {"type": "BOOLEAN", "nullable": True},
+        "color": {"type": "STRING", "nullable": True},
+    },
+    "required": ["text"],
+}
+
+PARAGRAPH_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "style": {"type": "STRING"},
+        "runs": {"type": "ARRAY", "items": RUN_SCHEMA},
+    },
+    "required": ["style", "runs"],
+}
+
+# A filled form: one entry per paragraph, in template order
+FORM_SCHEMA = {"type": "ARRAY", "items": PARAGRAPH_SCHEMA}
+
+# A filled form in the blueprint's compact form: format ids instead of repeated style/run attributes
+COMPACT_RUN_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "text": {"type": "STRING"},
+        "format": {"type": "INTEGER"},
+    },
+    "required": ["text", "format"],
+}
+
+COMPACT_FORM_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "format": {"type": "INTEGER"},
+            "runs": {"type": "ARRAY", "items": COMPACT_RUN_SCHEMA},
+        },
+        "required": ["format", "runs"],
+    },
+}
+
+# The CACI forms checked on an LA CIV 244
+CACI_FORMS_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "CACI Number": {"type": "STRING"},
+            "Jury Instructions": {"type": "STRING"},
+        },
+        "required": ["CACI Number", "Jury Instructions"],
+    },
+}
+
+def object_schema(fields, required=False):
+    """Schema for a flat object of string fields (e.g. case facts, or values by placeholder id)
+
+    Fields are nullable unless `required`, in which case every field must be
+    present with a string value, so an empty {} reply is rejected.
+    """
+    if required:
+        return {
+            "type": "OBJECT",
+            "properties": {name: {"type": "STRING"} for name in fields},
+            "required": list(fields),
+        }
+    return {
+        "type": "OBJECT",
+        "properties": {name: {"type": "STRING", "nullable": True} for name in fields},
+    }
+
+
+def json_config(schema):
+    """Generation config that makes Gemini answer with JSON matching `schema`"""
+    return types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_schema=schema,
+    )
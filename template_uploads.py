@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from google.genai import errors, types
+
+# Registry of uploaded template files, shared by every process on this machine
+UPLOAD_REGISTRY_PATH = "template_uploads.json"
+
+# Gemini keeps uploaded files for 48 hours; stop reusing a handle a bit before that
+UPLOAD_LIFETIME = 48 * 60 * 60
+UPLOAD_SAFETY_MARGIN = 60 * 60
+
+_handles = {}
+_lock = threading.Lock()
+
+
+def file_sha256(path):
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_registry(registry_path):
+    try:
+        with open(registry_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_registry(registry, registry_path):
+    tmp_path = f"{registry_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(registry, f, indent=2)
+    os.replace(tmp_path, registry_path)
+
+
+def _account_of(client):
+    """Identify the API key or Vertex project an upload belongs to; files are not visible to other accounts"""
+    api_client = getattr(client, "_api_client", None)
+    if getattr(api_client, "vertexai", False):
+        return f"vertex:{api_client.project}:{api_client.location}"
+    # Only a digest of the key is written to the shared registry
+    api_key = getattr(api_client, "api_key", None) or ""
+    return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def _registry_key(client, template_path):
+    return f"{_account_of(client)}:{file_sha256(template_path)}"
+
+
+def is_missing_file_error(error):
+    """Whether a Gemini error means an uploaded file is gone or belongs to another account"""
+    return isinstance(error, errors.ClientError) and error.code in (403, 404)
+
+
+def _expiry_of(uploaded):
+    """Epoch seconds after which an uploaded file should no longer be used"""
+    expiration = getattr(uploaded, "expiration_time", None)
+    if expiration is not None:
+        return expiration.timestamp() - UPLOAD_SAFETY_MARGIN
+    return time.time() + UPLOAD_LIFETIME - UPLOAD_SAFETY_MARGIN
+
+
+def get_template_file(client, template_path, registry_path=UPLOAD_REGISTRY_PATH, rate_limiter=None):
+    """Return a Gemini file handle for `template_path`, uploading it only when needed
+
+    Handles are keyed on the account (API key or project) and the SHA-256 of
+    the file, so the same blueprint is uploaded once per account and reused
+    across forms, requests and worker processes until the upload is close
+    to expiring or Gemini no longer has it (see reupload_template_file).
+    """
+    key = _registry_key(client, template_path)
+    now = time.time()
+
+    with _lock:
+        entry = _handles.get(key)
+        if entry is None or entry["expires"] <= now:
+            entry = _load_registry(registry_path).get(key)
+
+        if entry is None or entry["expires"] <= now:
+            if rate_limiter:
+                rate_limiter.wait()
+            uploaded = client.files.upload(file=template_path)
+            entry = {
+                "name": uploaded.name,
+                "uri": uploaded.uri,
+                "mime_type": uploaded.mime_type,
+                "expires": _expiry_of(uploaded),
+            }
+            registry = _load_registry(registry_path)
+            registry = {k: v for k, v in registry.items() if v["expires"] > now}
+            registry[key] = entry
+            _save_registry(registry, registry_path)
+
+        _handles[key] = entry
+
+    return types.File(name=entry["name"], uri=entry["uri"], mime_type=entry["mime_type"])
+
+
+def reupload_template_file(client, template_path, stale, registry_path=UPLOAD_REGISTRY_PATH, rate_limiter=None):
+    """Drop the registered `stale` handle of `template_path` and return a fresh upload
+
+    Called when Gemini answers 404/403 for a handle that has not expired
+    (deleted, or uploaded with another key). If another thread already
+    replaced the handle, its upload is reused.
+    """
+    key = _registry_key(client, template_path)
+    with _lock:
+        if _handles.get(key, {}).get("name") == stale.name:
+            del _handles[key]
+        registry = _load_registry(registry_path)
+        if registry.get(key, {}).get("name") == stale.name:
+            del registry[key]
+            _save_registry(registry, registry_path)
+    return get_template_file(client, template_path, registry_path, rate_limiter)
+
+
+def call_with_template_file(client, template_path, call, registry_path=UPLOAD_REGISTRY_PATH, rate_limiter=None):
+    """Return call(file) for the template's handle, uploading it again once if Gemini no longer has it"""
+    myfile = get_template_file(client, template_path, registry_path, rate_limiter)
+    try:
+        return call(myfile)
+    except Exception as e:
+        if not is_missing_file_error(e):
+            raise
+        print(f"Uploaded template {myfile.name} is no longer available, uploading it again")
+        return call(reupload_template_file(client, template_path, myfile, registry_path, rate_limiter))
@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+# The modules are top-level scripts in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def template_path(tmp_path):
+    """A small master template: CACI 101 and 4302 with red #placeholders#, a table and a header"""
+    from docx import Document
+    from docx.shared import RGBColor
+
+    def placeholder(paragraph, text):
+        paragraph.add_run(text).font.color.rgb = RGBColor(0xFF, 0, 0)
+
+    doc = Document()
+    doc.sections[0].header.paragraphs[0].text = "LAFLA"
+    doc.add_paragraph("CACI No. 101. Overview of Trial", style="Heading 1")
+    paragraph = doc.add_paragraph("Plaintiff ", style="List Paragraph")
+    placeholder(paragraph, "#Plaintiff Name#")
+    paragraph.add_run(" sues.").bold = True
+    doc.add_paragraph("2019. The landlord served the notice, 500. dollars were paid.")
+    doc.add_table(rows=1, cols=1).cell(0, 0).text = "cell"
+    doc.add_paragraph("4302. Termination for Failure to Pay Rent", style="Heading 1")
+    paragraph = doc.add_paragraph("Tenant ")
+    placeholder(paragraph, "#Defendant#")
+    paragraph.add_run(" owes ")
+    placeholder(paragraph, "#Rent Due#")
+    path = tmp_path / "template.docx"
+    doc.save(path)
+    return str(path)
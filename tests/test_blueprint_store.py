@@ -0,0 +1,85 @@
+import json
+
+import blueprint_store
+from blueprint_store import (load_blueprint, blueprint_text_path, to_template_data, form_slice, form_text,
+                             expand_form, normalize_caci_number)
+
+
+def test_forms_and_placeholders_are_indexed(template_path, tmp_path):
+    blueprint = load_blueprint(template_path, store_dir=str(tmp_path / "blueprints"))
+    assert blueprint["forms"] == {"101": [0, 3], "4302": [3, 5]}
+    assert blueprint["placeholders"] == [[1, 1, "#Plaintiff Name#"], [4, 1, "#Defendant#"], [4, 3, "#Rent Due#"]]
+
+
+def test_formats_are_interned(template_path, tmp_path):
+    blueprint = load_blueprint(template_path, store_dir=str(tmp_path / "blueprints"))
+    formats = blueprint["formats"]
+    assert len(formats) == len(set(formats))
+    assert ("List Paragraph", True, None, None) in formats
+    tenant = blueprint["runs"][blueprint["paragraphs"][4].first_run]
+    owes = blueprint["runs"][blueprint["paragraphs"][4].first_run + 2]
+    assert (tenant.text, owes.text) == ("Tenant ", " owes ")
+    assert tenant.format_id == owes.format_id
+
+
+def test_form_slice_keeps_styles_formatting_and_placeholder_ids(template_path, tmp_path):
+    blueprint = load_blueprint(template_path, store_dir=str(tmp_path / "blueprints"))
+    paragraphs = form_slice(blueprint, "CACI No. 101")
+    assert [para["style"] for para in paragraphs] == ["Heading 1", "List Paragraph", "Normal"]
+    assert paragraphs[1]["runs"] == [
+        {"text": "Plaintiff ", "bold": None, "italic": None, "color": None},
+        {"text": "#Plaintiff Name#", "bold": None, "italic": None, "color": "FF0000"},
+        {"text": " sues.", "bold": True, "italic": None, "color": None},
+    ]
+    assert paragraphs[1]["placeholders"] == [{"placeholder": "#Plaintiff Name#", "position": 1, "id": "0"}]
+    assert form_slice(blueprint, "4340") is None
+
+
+def test_compact_text_expands_back_to_the_template(template_path, tmp_path):
+    blueprint = load_blueprint(template_path, store_dir=str(tmp_path / "blueprints"))
+    lines = form_text(blueprint, "4302").splitlines()
+    formats = json.loads(lines[0])["formats"]
+    assert formats[str(blueprint["paragraphs"][3].format_id)]["style"] == "Heading 1"
+    expanded = expand_form([json.loads(line) for line in lines[1:]], blueprint)
+    assert expanded == [{"style": para["style"], "runs": para["runs"]} for para in to_template_data(blueprint, 3, 5)]
+
+
+def test_expand_form_tolerates_bad_format_ids(template_path, tmp_path):
+    blueprint = load_blueprint(template_path, store_dir=str(tmp_path / "blueprints"))
+    assert expand_form([{"format": 999, "runs": [{"text": "x", "format": "1"}]}, "junk"], blueprint) == [
+        {"style": "Normal", "runs": [{"text": "x", "bold": None, "italic": None, "color": None}]}
+    ]
+
+
+def test_stored_artifact_is_reused(template_path, tmp_path, monkeypatch):
+    # Blueprints are also cached in memory by template hash; start from (and go back to) an empty cache
+    store_dir = str(tmp_path / "blueprints")
+    monkeypatch.setattr(blueprint_store, "_loaded", {})
+    compiled = load_blueprint(template_path, store_dir=store_dir)
+    monkeypatch.setattr(blueprint_store, "_loaded", {})
+    monkeypatch.setattr(blueprint_store, "compile_blueprint", lambda path: (_ for _ in ()).throw(AssertionError))
+    loaded = load_blueprint(template_path, store_dir=store_dir)
+    assert to_template_data(loaded) == to_template_data(compiled)
+    assert loaded["formats"] == compiled["formats"]
+    with open(blueprint_text_path(loaded, store_dir), encoding="utf-8") as f:
+        assert len(f.read().splitlines()) == 1 + len(loaded["paragraphs"])
+
+
+def test_normalize_caci_number():
+    assert normalize_caci_number("CACI No. 4329") == "4329"
+    assert normalize_caci_number(" 101 ") == "101"
+    assert normalize_caci_number(4302) == "4302"
+
+
+def test_numbered_body_text_does_not_start_a_form(tmp_path):
+    from docx import Document
+
+    doc = Document()
+    doc.add_paragraph("4303. Sufficiency and Service of Notice").runs[0].bold = True
+    doc.add_paragraph("2019. The landlord raised the rent.")
+    doc.add_paragraph("500. Dollars were paid", style="List Paragraph")
+    doc.add_paragraph("CACI No. 4305 Sufficiency of Notice")
+    path = tmp_path / "numbered.docx"
+    doc.save(path)
+    blueprint = load_blueprint(str(path), store_dir=str(tmp_path / "blueprints"))
+    assert blueprint["forms"] == {"4303": [0, 3], "4305": [3, 4]}
@@ -0,0 +1,98 @@
+import pytest
+
+pytest.importorskip("google.genai")
+
+from case_facts import resolve_placeholder, local_fill, fill_placeholders, form_placeholders, resolve_with_model
+
+FACTS = {
+    "plaintiff": "Acme Properties LLC",
+    "defendant": "Jane Tenant",
+    "landlord": "Acme Properties LLC",
+    "address": "123 Main St",
+    "city": "Los Angeles",
+    "rent_amount": "$1,500",
+}
+
+
+@pytest.mark.parametrize("placeholder, expected", [
+    ("#Plaintiff#", "Acme Properties LLC"),
+    ("#Defendant#", "Jane Tenant"),
+    ("#Name of Defendant#", "Jane Tenant"),
+    ("#Defendant Name#", "Jane Tenant"),
+    ("#Defendant's Name#", "Jane Tenant"),
+    ("#Plaintiff Full Name#", "Acme Properties LLC"),
+    ("#Owner#", "Acme Properties LLC"),
+    ("#Owner Name#", "Acme Properties LLC"),
+    ("#Property Address#", "123 Main St"),
+    ("#Monthly Rent#", "$1,500"),
+    ("#City#", "Los Angeles"),
+])
+def test_resolves_exact_alias_and_name_placeholders(placeholder, expected):
+    assert resolve_placeholder(placeholder, FACTS) == expected
+
+
+@pytest.mark.parametrize("placeholder", [
+    "#Landlord Address#",
+    "#Defendant Address#",
+    "#Plaintiff's Attorney#",
+    "#City of Defendant's employer#",
+    "#Date of Notice#",
+    "#Tenant#",
+])
+def test_leaves_placeholders_that_only_mention_a_fact_to_the_model(placeholder):
+    assert resolve_placeholder(placeholder, FACTS) is None
+
+
+def form():
+    return [
+        {"style": "Normal", "runs": [
+            {"text": "Plaintiff ", "bold": False, "italic": False, "color": None},
+            {"text": "#Plaintiff#", "bold": False, "italic": False, "color": "FF0000"},
+            {"text": " sued ", "bold": False, "italic": False, "color": None},
+            {"text": "#Defendant Address#", "bold": False, "italic": False, "color": "FF0000"},
+        ], "placeholders": [
+            {"placeholder": "#Plaintiff#", "position": 1, "id": "7"},
+            {"placeholder": "#Defendant Address#", "position": 3, "id": "8"},
+        ]},
+        {"style": "Normal", "runs": [
+            {"text": "#Plaintiff#", "bold": True, "italic": False, "color": "FF0000"},
+        ], "placeholders": [{"placeholder": "#Plaintiff#", "position": 0, "id": "9"}]},
+    ]
+
+
+def test_local_fill_splits_resolved_and_unresolved():
+    values, unresolved = local_fill(form(), FACTS)
+    assert values == {"#Plaintiff#": "Acme Properties LLC"}
+    assert unresolved == ["#Defendant Address#"]
+
+
+def test_fill_placeholders_replaces_every_occurrence_without_touching_the_input():
+    paragraphs = form()
+    filled = fill_placeholders(paragraphs, {"#Plaintiff#": "Acme", "#Defendant Address#": "9 Elm St"})
+    assert "".join(run["text"] for run in filled[0]["runs"]) == "Plaintiff Acme sued 9 Elm St"
+    assert filled[1]["runs"][0] == {"text": "Acme", "bold": True, "italic": False, "color": "FF0000"}
+    assert paragraphs[0]["runs"][1]["text"] == "#Plaintiff#"
+
+
+def test_form_placeholders_are_keyed_by_id_once_per_text():
+    assert form_placeholders(form()) == {
+        "7": {"placeholder": "#Plaintiff#", "context": "Plaintiff #Plaintiff# sued #Defendant Address#"},
+        "8": {"placeholder": "#Defendant Address#", "context": "Plaintiff #Plaintiff# sued #Defendant Address#"},
+    }
+    assert list(form_placeholders(form(), ["#Defendant Address#"])) == ["8"]
+
+
+def test_model_must_answer_every_placeholder_id():
+    calls = []
+
+    class Models:
+        def generate_content(self, **kwargs):
+            calls.append(kwargs)
+            return type("Response", (), {"text": '{"7": "Acme", "9": "ignored"}'})()
+
+    client = type("Client", (), {"models": Models()})()
+    values = resolve_with_model(client, "101", form_placeholders(form()), "Acme sued Jane")
+    assert values == {"#Plaintiff#": "Acme"}
+    schema = calls[0]["config"].response_schema
+    assert schema["required"] == ["7", "8"]
+    assert not schema["properties"]["7"].get("nullable")
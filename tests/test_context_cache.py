@@ -0,0 +1,85 @@
+import pytest
+
+pytest.importorskip("google.genai")
+
+from google.genai import types
+
+from context_cache import SharedContext, CachedContext, open_shared_context, CONTEXT_CACHE_MODEL
+
+CASE_SUMMARY = "Case information: " + "The tenant withheld rent over unrepaired leaks. " * 400
+
+
+class Stub:
+    """Records the calls made to it and returns `result`"""
+    def __init__(self, result=None, error=None):
+        self.calls = []
+        self.result = result
+        self.error = error
+
+    def __call__(self, **kwargs):
+        self.calls.append(kwargs)
+        if self.error:
+            raise self.error
+        return self.result
+
+
+class Client:
+    """Stands in for genai.Client: models.generate_content/count_tokens and caches.create/delete"""
+    def __init__(self, tokens=10000, create_error=None):
+        self.models = type("Models", (), {})()
+        self.models.generate_content = Stub(result="reply")
+        self.models.count_tokens = Stub(result=types.CountTokensResponse(total_tokens=tokens))
+        self.caches = type("Caches", (), {})()
+        self.caches.create = Stub(result=type("Cache", (), {"name": "cachedContents/abc"})(), error=create_error)
+        self.caches.delete = Stub()
+
+
+def test_inline_context_is_sent_before_every_prompt():
+    client = Client()
+    shared = SharedContext([CASE_SUMMARY])
+    config = types.GenerateContentConfig(response_mime_type="application/json")
+    assert shared.generate(client, ["Fill CACI 4302"], config) == "reply"
+    assert client.models.generate_content.calls == [
+        {"model": CONTEXT_CACHE_MODEL, "contents": [CASE_SUMMARY, "Fill CACI 4302"], "config": config}]
+
+
+def test_cached_context_references_the_cache_and_keeps_the_config():
+    client = Client()
+    shared = CachedContext("cachedContents/abc")
+    config = types.GenerateContentConfig(response_mime_type="application/json")
+    shared.generate(client, ["Fill CACI 4302"], config)
+    shared.generate(client, ["Fill CACI 4303"])
+    first, second = client.models.generate_content.calls
+    assert first["contents"] == ["Fill CACI 4302"]
+    assert first["config"].cached_content == "cachedContents/abc"
+    assert first["config"].response_mime_type == "application/json"
+    assert config.cached_content is None
+    assert second["config"].cached_content == "cachedContents/abc"
+    shared.close(client)
+    assert client.caches.delete.calls == [{"name": "cachedContents/abc"}]
+
+
+def test_large_contents_are_cached():
+    client = Client(tokens=10000)
+    shared = open_shared_context(client, [CASE_SUMMARY])
+    assert isinstance(shared, CachedContext) and shared.name == "cachedContents/abc"
+    assert client.caches.create.calls[0]["model"] == CONTEXT_CACHE_MODEL
+
+
+def test_short_text_is_sent_inline_without_any_call():
+    client = Client()
+    shared = open_shared_context(client, ["Case information: a short summary"])
+    assert type(shared) is SharedContext
+    assert client.models.count_tokens.calls == [] and client.caches.create.calls == []
+
+
+def test_contents_below_the_minimum_tokens_are_sent_inline():
+    client = Client(tokens=1200)
+    assert type(open_shared_context(client, [CASE_SUMMARY])) is SharedContext
+    assert len(client.models.count_tokens.calls) == 1 and client.caches.create.calls == []
+
+
+def test_failed_cache_creation_falls_back_to_inline():
+    client = Client(create_error=RuntimeError("caching not supported"))
+    shared = open_shared_context(client, [CASE_SUMMARY])
+    assert type(shared) is SharedContext and shared.contents == [CASE_SUMMARY]
@@ -0,0 +1,77 @@
+from docx import Document
+
+from blueprint_store import load_blueprint
+from docx_renderer import DocxBuilder, load_template_body
+
+
+def runs_of(paragraph):
+    return [(run.text, run.bold, run.font.color.rgb and str(run.font.color.rgb)) for run in paragraph.runs]
+
+
+def test_builder_writes_styled_runs(tmp_path):
+    doc = DocxBuilder()
+    doc.add_form("4302", "Rent", [
+        {"style": "Normal", "runs": [
+            {"text": "Jane & <Co>", "bold": True, "italic": False, "color": "#FF0000"},
+            {"text": " owes", "bold": False, "italic": None, "color": "auto"},
+        ]},
+        {"style": "No Such Style", "runs": [{"text": "still rendered"}]},
+    ])
+    doc.add_page_break()
+    doc.add_error("Error processing CACI 4303: timeout")
+    path = tmp_path / "out.docx"
+    doc.save(path)
+
+    paragraphs = Document(path).paragraphs
+    assert paragraphs[0].text == "CACI 4302: Rent"
+    assert runs_of(paragraphs[1]) == [("Jane & <Co>", True, "FF0000"), (" owes", False, None)]
+    assert paragraphs[2].text == "still rendered"
+    assert paragraphs[-1].text == "Error processing CACI 4303: timeout"
+
+
+def test_builder_output_matches_for_equal_input(tmp_path):
+    form = [{"style": "Heading 1", "runs": [{"text": "a\tb\nc", "bold": None, "italic": True, "color": None}]}]
+    for name in ("a.docx", "b.docx"):
+        doc = DocxBuilder()
+        doc.add_form("101", "Overview", form)
+        doc.save(tmp_path / name)
+    first, second = (Document(tmp_path / name).paragraphs for name in ("a.docx", "b.docx"))
+    assert [p.text for p in first] == [p.text for p in second] == ["CACI 101: Overview", "a\tb\nc"]
+    assert first[1].style.name == "Heading 1"
+
+
+def test_template_body_patches_only_placeholder_runs(template_path, tmp_path):
+    blueprint = load_blueprint(template_path, store_dir=str(tmp_path / "blueprints"))
+    body = load_template_body(template_path, blueprint)
+    doc = body.builder()
+    doc.add_xml(body.form_xml("101", {"#Plaintiff Name#": "Acme & Sons"}))
+    doc.add_page_break()
+    doc.add_xml(body.form_xml("4302", {"#Defendant#": "Jane"}))
+    assert body.form_xml("4340", {}) is None
+    path = tmp_path / "out.docx"
+    doc.save(path)
+
+    out = Document(path)
+    assert out.sections[0].header.paragraphs[0].text == "LAFLA"
+    assert out.tables[0].cell(0, 0).text == "cell"
+    texts = [p.text for p in out.paragraphs if p.text]
+    assert texts == ["CACI No. 101. Overview of Trial", "Plaintiff Acme & Sons sues.",
+                     "2019. The landlord served the notice, 500. dollars were paid.",
+                     "4302. Termination for Failure to Pay Rent", "Tenant Jane owes #Rent Due#"]
+    filled = next(p for p in out.paragraphs if p.text.startswith("Plaintiff"))
+    assert filled.style.name == "List Paragraph"
+    assert runs_of(filled) == [("Plaintiff ", None, None), ("Acme & Sons", None, "FF0000"), (" sues.", True, None)]
+
+
+def test_whole_form_replies_keep_the_template_package(template_path, tmp_path):
+    blueprint = load_blueprint(template_path, store_dir=str(tmp_path / "blueprints"))
+    doc = load_template_body(template_path, blueprint).builder()
+    doc.add_paragraphs([{"style": "List Paragraph", "runs": [{"text": "Plaintiff Acme sues.", "bold": True}]}])
+    path = tmp_path / "out.docx"
+    doc.save(path)
+
+    out = Document(path)
+    assert out.sections[0].header.paragraphs[0].text == "LAFLA"
+    assert [p.text for p in out.paragraphs] == ["Plaintiff Acme sues."]
+    assert out.paragraphs[0].style.name == "List Paragraph"
+    assert runs_of(out.paragraphs[0]) == [("Plaintiff Acme sues.", True, None)]
@@ -0,0 +1,49 @@
+import pytest
+
+pytest.importorskip("PyPDF2")
+
+import form_identification
+from form_identification import CACI_TITLES, caci_number_for_field, identify_caci_forms
+
+
+@pytest.mark.parametrize("name, tooltip, expected", [
+    ("CACI 4302", None, "4302"),
+    ("CheckBox104", "CACI 4320. Affirmative Defense—Implied Warranty of Habitability", "4320"),
+    ("Check Box 120", "Retaliatory eviction (CACI 4321)", "4321"),
+    ("CheckBox104", None, None),
+    ("Check Box 120", "Other", None),
+    ("Page 2 CACI 4303", None, "4303"),
+])
+def test_only_known_caci_numbers_are_taken_from_names_and_tooltips(name, tooltip, expected):
+    field = {"/TU": tooltip} if tooltip else {}
+    assert caci_number_for_field(name, field, {}) == expected
+
+
+def test_field_map_wins_and_adds_known_numbers():
+    assert caci_number_for_field("Check Box12", {}, {"Check Box12": "4320"}) == "4320"
+    assert caci_number_for_field("Box", {"/TU": "CACI 4340"}, {"Other": "4340"}) == "4340"
+
+
+def checkboxes(monkeypatch, fields):
+    monkeypatch.setattr(form_identification, "PdfReader", lambda path: type("Reader", (), {"get_fields": lambda self: fields})())
+
+
+def test_checked_boxes_become_forms(monkeypatch):
+    checkboxes(monkeypatch, {
+        "CACI 4302": {"/FT": "/Btn", "/V": "/Yes"},
+        "CACI 4320": {"/FT": "/Btn", "/V": "/Off"},
+        "Defendant": {"/FT": "/Tx", "/V": "Jane Tenant"},
+        "CheckBox104": {"/FT": "/Btn", "/V": "/Yes", "/TU": "CACI 4303"},
+    })
+    assert identify_caci_forms("civ244.pdf", field_map={}) == [
+        {"CACI Number": "4302", "Jury Instructions": CACI_TITLES["4302"]},
+        {"CACI Number": "4303", "Jury Instructions": CACI_TITLES["4303"]},
+    ]
+
+
+def test_an_unmapped_checked_box_defers_to_the_model(monkeypatch):
+    checkboxes(monkeypatch, {
+        "CACI 4302": {"/FT": "/Btn", "/V": "/Yes"},
+        "Check Box 120": {"/FT": "/Btn", "/V": "/Yes", "/TU": "Other instruction"},
+    })
+    assert identify_caci_forms("civ244.pdf", field_map={}) is None
@@ -0,0 +1,45 @@
+import pytest
+
+from json_parser import extract_json_objects, extract_json_object, iter_json_values
+
+
+def test_fenced_array_with_prose_around_it():
+    text = 'Here is the form:\n```json\n[{"style": "Normal"}, {"style": "Heading 1"}]\n```\nDone.'
+    assert extract_json_objects(text) == [{"style": "Normal"}, {"style": "Heading 1"}]
+
+
+def test_concatenated_objects():
+    assert extract_json_objects('{"a": 1}\n{"b": 2}{"c": 3}') == [{"a": 1}, {"b": 2}, {"c": 3}]
+
+
+def test_braces_and_escaped_quotes_inside_strings():
+    text = '{"text": "a } b [ c \\" d {"}'
+    assert extract_json_objects(text) == [{"text": 'a } b [ c " d {'}]
+
+
+def test_quotes_in_surrounding_prose_are_ignored():
+    assert extract_json_object('The model said "ok": {"1": "Jane"}') == {"1": "Jane"}
+
+
+def test_trailing_commas_are_repaired():
+    assert extract_json_objects('[{"a": 1,}, {"b": [1, 2,],},]') == [{"a": 1}, {"b": [1, 2]}]
+
+
+def test_truncated_reply_is_closed():
+    assert list(iter_json_values('[{"text": "Plaintiff sues"}, {"text": "Tenant ow')) == [
+        [{"text": "Plaintiff sues"}, {"text": "Tenant ow"}]
+    ]
+
+
+def test_no_json_raises():
+    with pytest.raises(ValueError):
+        extract_json_objects("no json here")
+    with pytest.raises(ValueError):
+        extract_json_object("[1, 2]")
+
+
+def test_only_objects_are_kept():
+    text = 'See [1] below\n```json\n[{"CACI Number": "4302"}, 7, "x"]\n```\nand 3.'
+    assert extract_json_objects(text) == [{"CACI Number": "4302"}]
+    with pytest.raises(ValueError):
+        extract_json_objects("[1, 2, 3]")
@@ -0,0 +1,118 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip("google.generativeai")
+pytest.importorskip("langchain_community")
+pytest.importorskip("PyPDF2")
+pytest.importorskip("pdf2image")
+pytest.importorskip("requests")
+
+import rag_system
+from rag_system import DocumentRetriever, IVFIndex, exact_search, normalize
+
+
+class Page:
+    def __init__(self, text, number):
+        self.page_content = text
+        self.metadata = {"page": number}
+
+
+class LineSplitter:
+    """One chunk per line, standing in for the recursive splitter"""
+    def __init__(self, **options):
+        pass
+
+    def split_documents(self, pages):
+        return [Page(line, page.metadata["page"]) for page in pages for line in page.page_content.splitlines()]
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    """A retriever over a fake PDF whose pages are set through `index.pages`"""
+    embedded = []
+
+    def embed_texts(texts, task_type="retrieval_document", rate_limiter=None):
+        embedded.extend(texts)
+        rng = np.random.default_rng(len(embedded))
+        return normalize(rng.standard_normal((len(texts), 8)).astype(np.float32))
+
+    pdf_path = tmp_path / "case.pdf"
+    retriever = DocumentRetriever(str(pdf_path), index_dir=str(tmp_path / "index"), api_key="test")
+    monkeypatch.setattr(rag_system, "embed_texts", embed_texts)
+    monkeypatch.setattr(rag_system, "RecursiveCharacterTextSplitter", LineSplitter)
+    monkeypatch.setattr(rag_system, "form_field_pages", lambda path: dict(retriever.fields))
+    monkeypatch.setattr(rag_system, "PyPDFLoader", lambda path: type("Loader", (), {
+        "load": lambda self: [Page(text, i) for i, text in enumerate(retriever.pages)]})())
+
+    def update(pages, fields=None):
+        retriever.pages = pages
+        retriever.fields = fields or {}
+        pdf_path.write_text("\f".join(pages) + repr(retriever.fields))
+        retriever.process_document()
+        return retriever
+
+    update.embedded = embedded
+    return update
+
+
+def test_unchanged_pages_reuse_their_embeddings(index):
+    retriever = index(["rent due\nnotice served", "habitability"])
+    first = np.array(retriever.embeddings)
+    retriever = index(["rent due\nnotice served", "repairs requested"])
+    assert index.embedded == ["rent due", "notice served", "habitability", "repairs requested"]
+    assert [chunk["text"] for chunk in retriever.chunks] == ["rent due", "notice served", "repairs requested"]
+    np.testing.assert_array_equal(retriever.embeddings[:2], first[:2])
+
+
+def test_identical_pages_keep_one_copy_of_their_chunks(index):
+    blank = "This page intentionally left blank"
+    pages = [blank, "4302 rent", blank, "4303 notice", blank]
+    for update in range(4):
+        pages[1] = f"4302 rent, revision {update}"
+        retriever = index(pages)
+        assert [chunk["text"] for chunk in retriever.chunks] == [blank, pages[1], blank, "4303 notice", blank]
+        assert [chunk["page"] for chunk in retriever.chunks] == [0, 1, 2, 3, 4]
+        assert len(retriever.embeddings) == 5
+
+
+def test_ivf_search_matches_exact_search_when_probing_every_list():
+    rng = np.random.default_rng(0)
+    matrix = normalize(rng.standard_normal((500, 16)).astype(np.float32))
+    query = matrix[42]
+    ivf = IVFIndex.build(matrix, n_lists=10)
+    assert exact_search(matrix, query, 5)[0] == 42
+    assert list(ivf.search(matrix, query, 5, nprobe=10)) == list(exact_search(matrix, query, 5))
+
+
+def test_filled_form_fields_are_indexed(index):
+    retriever = index(["UD-105 ANSWER\nDefendant (name):", "Page two"], fields={1: "Defendant: JANE TENANT"})
+    assert [(chunk["text"], chunk["page"]) for chunk in retriever.chunks] == [
+        ("UD-105 ANSWER", 0), ("Defendant (name):", 0), ("Defendant: JANE TENANT", 0), ("Page two", 1)]
+    retriever = index(["UD-105 ANSWER\nDefendant (name):", "Page two"], fields={1: "Defendant: JOHN OTHERPERSON"})
+    assert "Defendant: JOHN OTHERPERSON" in [chunk["text"] for chunk in retriever.chunks]
+    assert "Defendant: JANE TENANT" not in [chunk["text"] for chunk in retriever.chunks]
+
+
+def test_concurrent_jobs_embed_a_shared_index_once(index, monkeypatch):
+    first = index(["4302 rent\n4303 notice"])
+    first.pages = ["4302 rent, revised\n4303 notice, revised"]
+    with open(first.pdf_path, "w") as f:
+        f.write("revised")
+    slow_embed = rag_system.embed_texts
+
+    def embed_texts(texts, **options):
+        time.sleep(0.05)
+        return slow_embed(texts, **options)
+
+    monkeypatch.setattr(rag_system, "embed_texts", embed_texts)
+    retrievers = [DocumentRetriever(first.pdf_path, index_dir=first.index_dir, api_key="test") for _ in range(2)]
+    threads = [threading.Thread(target=retriever.process_document) for retriever in retrievers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert index.embedded == ["4302 rent", "4303 notice", "4302 rent, revised", "4303 notice, revised"]
+    assert [len(retriever.chunks) for retriever in retrievers] == [2, 2]
@@ -0,0 +1,81 @@
+import datetime
+
+import pytest
+
+pytest.importorskip("google.genai")
+
+from google import genai
+from google.genai import errors, types
+
+import template_uploads
+from template_uploads import get_template_file, call_with_template_file
+
+
+class Files:
+    """Stands in for client.files, numbering each upload"""
+    def __init__(self):
+        self.uploads = 0
+
+    def upload(self, file):
+        self.uploads += 1
+        expires = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=48)
+        return types.File(name=f"files/{self.uploads}", uri=f"https://files/{self.uploads}",
+                          mime_type="text/plain", expiration_time=expires)
+
+
+class Client:
+    """A genai.Client's account with stub file uploads"""
+    def __init__(self, api_key, files):
+        self._api_client = genai.Client(api_key=api_key)._api_client
+        self.files = files
+
+
+@pytest.fixture
+def template(tmp_path, monkeypatch):
+    monkeypatch.setattr(template_uploads, "_handles", {})
+    path = tmp_path / "output.txt"
+    path.write_text("CACI No. 101 #Plaintiff Name#", encoding="utf-8")
+    return str(path), str(tmp_path / "template_uploads.json")
+
+
+def test_handles_are_reused_per_account(template):
+    path, registry = template
+    files = Files()
+    first = get_template_file(Client("key-a", files), path, registry)
+    assert get_template_file(Client("key-a", files), path, registry).name == first.name
+    template_uploads._handles.clear()
+    assert get_template_file(Client("key-a", files), path, registry).name == first.name
+    assert get_template_file(Client("key-b", files), path, registry).name != first.name
+    assert files.uploads == 2
+    assert "key-a" not in open(registry, encoding="utf-8").read()
+
+
+def test_missing_upload_is_replaced_and_the_call_retried(template):
+    path, registry = template
+    files = Files()
+    client = Client("key-a", files)
+    stale = get_template_file(client, path, registry)
+    seen = []
+
+    def call(myfile):
+        seen.append(myfile.name)
+        if myfile.name == stale.name:
+            raise errors.ClientError(404, {"error": {"code": 404, "message": "File not found", "status": "NOT_FOUND"}})
+        return "reply"
+
+    assert call_with_template_file(client, path, call, registry) == "reply"
+    assert seen == [stale.name, "files/2"]
+    template_uploads._handles.clear()
+    assert get_template_file(client, path, registry).name == "files/2"
+
+
+def test_other_errors_are_not_retried(template):
+    path, registry = template
+    files = Files()
+
+    def call(myfile):
+        raise errors.ClientError(400, {"error": {"code": 400, "message": "Bad request", "status": "INVALID_ARGUMENT"}})
+
+    with pytest.raises(errors.ClientError):
+        call_with_template_file(Client("key-a", files), path, call, registry)
+    assert files.uploads == 1
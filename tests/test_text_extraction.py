@@ -0,0 +1,51 @@
+import pytest
+
+pytest.importorskip("PyPDF2")
+pytest.importorskip("pdf2image")
+pytest.importorskip("requests")
+
+import text_extraction
+from text_extraction import ExtractionBackend, extract_text
+
+TEXT = "Plaintiff Acme Properties LLC v. Defendant Jane Tenant, unlawful detainer"
+
+
+class Backend(ExtractionBackend):
+    def __init__(self, name, pages, error=None):
+        self.name = name
+        self.pages = pages
+        self.error = error
+        self.calls = []
+
+    def extract_pages(self, pdf_path, page_numbers):
+        self.calls.append(list(page_numbers))
+        if self.error:
+            raise self.error
+        return {page_num: self.pages.get(page_num, "") for page_num in page_numbers}
+
+
+@pytest.fixture(autouse=True)
+def three_pages(monkeypatch):
+    monkeypatch.setattr(text_extraction, "PdfReader", lambda path: type("Reader", (), {"pages": [None] * 3})())
+
+
+def test_only_pages_without_text_are_ocred():
+    native = Backend("native", {1: TEXT, 3: TEXT})
+    remote = Backend("vision", {2: "scanned " + TEXT})
+    results = extract_text("case.pdf", backends={"native": native, "local_ocr": None, "remote": remote})
+    assert remote.calls == [[2]]
+    assert results == {1: TEXT, 2: "scanned " + TEXT, 3: TEXT}
+
+
+def test_failing_local_ocr_falls_through_to_vision():
+    local_ocr = Backend("tesseract", {}, error=RuntimeError("tesseract is not installed"))
+    remote = Backend("vision", {1: TEXT, 2: TEXT, 3: TEXT})
+    results = extract_text("case.pdf", prefer_local_ocr=True,
+                           backends={"native": Backend("native", {}), "local_ocr": local_ocr, "remote": remote})
+    assert remote.calls == [[1, 2, 3]]
+    assert results == {1: TEXT, 2: TEXT, 3: TEXT}
+
+
+def test_backends_must_implement_extract_pages():
+    with pytest.raises(TypeError):
+        ExtractionBackend()
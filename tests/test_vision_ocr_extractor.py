@@ -0,0 +1,60 @@
+import pytest
+
+pytest.importorskip("PyPDF2")
+pytest.importorskip("pdf2image")
+pytest.importorskip("requests")
+
+import vision_ocr_extractor
+from vision_ocr_extractor import page_fingerprints
+
+
+class Dictionary(dict):
+    """Stands in for a PyPDF2 dictionary object"""
+    def get_object(self):
+        return self
+
+
+class Array(list):
+    def get_object(self):
+        return self
+
+
+class Stream(Dictionary):
+    def __init__(self, data, **entries):
+        super().__init__(**entries)
+        self.data = data
+
+    def get_data(self):
+        return self.data
+
+
+class Page(Dictionary):
+    mediabox = [0, 0, 612, 792]
+
+    def get_contents(self):
+        return Stream(b"q /Fm0 Do Q")
+
+
+def fingerprint(monkeypatch, page):
+    monkeypatch.setattr(vision_ocr_extractor, "PdfReader", lambda path: type("Reader", (), {"pages": [page]})())
+    return page_fingerprints("case.pdf")[1]
+
+
+def scanned_page(image):
+    form = Stream(b"q /Im0 Do Q", **{"/Resources": Dictionary({"/XObject": Dictionary({"/Im0": Stream(image)})})})
+    return Page({"/Resources": Dictionary({"/XObject": Dictionary({"/Fm0": form})})})
+
+
+def filled_page(defendant):
+    widget = Dictionary({"/Subtype": "/Widget", "/T": "Defendant", "/V": defendant,
+                         "/AP": Dictionary({"/N": Stream(defendant.encode())})})
+    return Page({"/Annots": Array([widget])})
+
+
+def test_images_nested_in_form_xobjects_tell_pages_apart(monkeypatch):
+    assert fingerprint(monkeypatch, scanned_page(b"scan a")) != fingerprint(monkeypatch, scanned_page(b"scan b"))
+    assert fingerprint(monkeypatch, scanned_page(b"scan a")) == fingerprint(monkeypatch, scanned_page(b"scan a"))
+
+
+def test_form_field_values_tell_pages_apart(monkeypatch):
+    assert fingerprint(monkeypatch, filled_page("JANE TENANT")) != fingerprint(monkeypatch, filled_page("JOHN OTHERPERSON"))
@@ -0,0 +1,186 @@
+from abc import ABC, abstractmethod
+
+from PyPDF2 import PdfReader
+from pdf2image import convert_from_path
+
+from vision_ocr_extractor import extract_all_text_from_pdf_with_api_key
+
+try:
+    import pytesseract
+except ImportError:  # Tesseract is optional; scanned pages then go to Vision
+    pytesseract = None
+
+# A page with fewer extractable characters than this is treated as scanned
+MIN_TEXT_CHARS = 40
+
+
+class ExtractionBackend(ABC):
+    """Extracts the text of selected pages of a PDF"""
+    name = "base"
+
+    @abstractmethod
+    def extract_pages(self, pdf_path, page_numbers):
+        """Return a dictionary with page numbers as keys and extracted text as values"""
+
+
+def form_field_text(page):
+    """The filled form widgets of a page as "field: value" lines
+
+    extract_text() only returns the static text of a fillable form; the
+    entered names, addresses and dates are the widgets' /V values.
+    """
+    lines = []
+    for annot in (page["/Annots"].get_object() if "/Annots" in page else []):
+        annot = annot.get_object()
+        if annot.get("/Subtype") != "/Widget":
+            continue
+        field = annot["/Parent"].get_object() if "/V" not in annot and "/Parent" in annot else annot
+        value = field.get("/V")
+        if value is None or str(value) in ("", "/Off", "Off"):
+            continue
+        label = field.get("/TU") or field.get("/T") or annot.get("/T") or "Field"
+        line = f"{label}: {str(value).lstrip('/')}"
+        if line not in lines:  # radio buttons and checkbox kids share their parent's value
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def form_field_pages(pdf_path):
+    """form_field_text of every page with filled form fields, keyed by page number"""
+    try:
+        reader = PdfReader(pdf_path)
+    except Exception as e:
+        print(f"Could not read the form fields of {pdf_path}: {str(e)}")
+        return {}
+    pages = {}
+    for page_num, page in enumerate(reader.pages, start=1):
+        try:
+            text = form_field_text(page)
+        except Exception as e:
+            print(f"Could not read the form fields of page {page_num}: {str(e)}")
+            continue
+        if text:
+            pages[page_num] = text
+    return pages
+
+
+class NativeTextBackend(ExtractionBackend):
+    """Reads the PDF's own text layer and filled form fields with PyPDF2 (born-digital documents)"""
+    name = "native"
+
+    def extract_pages(self, pdf_path, page_numbers):
+        reader = PdfReader(pdf_path)
+        results = {}
+        for page_num in page_numbers:
+            try:
+                page = reader.pages[page_num - 1]
+                text = page.extract_text() or ""
+                fields = form_field_text(page)
+                results[page_num] = f"{text}\n{fields}" if fields else text
+            except Exception as e:
+                print(f"Could not read the text layer of page {page_num}: {str(e)}")
+                results[page_num] = ""
+        return results
+
+
+class TesseractBackend(ExtractionBackend):
+    """Local OCR with Tesseract for scanned pages"""
+    name = "tesseract"
+
+    def __init__(self, dpi=300, lang="eng"):
+        self.dpi = dpi
+        self.lang = lang
+
+    @staticmethod
+    def available():
+        """True when pytesseract is installed and can run the tesseract binary"""
+        if pytesseract is None:
+            return False
+        try:
+            pytesseract.get_tesseract_version()
+        except Exception:
+            return False
+        return True
+
+    def extract_pages(self, pdf_path, page_numbers):
+        results = {}
+        for page_num in page_numbers:
+            images = convert_from_path(pdf_path, dpi=self.dpi, first_page=page_num, last_page=page_num)
+            results[page_num] = pytesseract.image_to_string(images[0], lang=self.lang)
+            images[0].close()
+        return results
+
+
+class VisionBackend(ExtractionBackend):
+    """Remote OCR with the Google Cloud Vision API"""
+    name = "vision"
+
+    def __init__(self, api_key, **options):
+        self.api_key = api_key
+        self.options = options
+
+    def extract_pages(self, pdf_path, page_numbers):
+        return extract_all_text_from_pdf_with_api_key(
+            pdf_path, self.api_key, pages=list(page_numbers), **self.options
+        )
+
+
+def has_text(text, min_chars=MIN_TEXT_CHARS):
+    return len("".join(text.split())) >= min_chars
+
+
+def extract_text(pdf_path, api_key=None, prefer_local_ocr=False, min_chars=MIN_TEXT_CHARS, backends=None):
+    """Extract the text of every page, using the cheapest backend that works for each page
+
+    1. The native text layer is read for every page.
+    2. Pages without enough text are OCRed locally with Tesseract when
+       `prefer_local_ocr` is set or no Vision API key is given.
+    3. Pages still without text (or all of them, when local OCR fails) go
+       to the Vision API, if a key is given.
+
+    `backends` can override the engines as a dict with "native", "local_ocr"
+    and "remote" entries.
+
+    Returns:
+        A dictionary with page numbers as keys and extracted text as values
+    """
+    backends = backends or {}
+    native = backends.get("native", NativeTextBackend())
+    local_ocr = backends.get("local_ocr", TesseractBackend() if TesseractBackend.available() else None)
+    remote = backends.get("remote", VisionBackend(api_key) if api_key else None)
+
+    page_count = len(PdfReader(pdf_path).pages)
+    results = native.extract_pages(pdf_path, range(1, page_count + 1))
+    pending = [page_num for page_num, text in results.items() if not has_text(text, min_chars)]
+    print(f"{page_count - len(pending)}/{page_count} pages have a text layer")
+
+    if pending and local_ocr is not None and (prefer_local_ocr or remote is None):
+        try:
+            results.update(local_ocr.extract_pages(pdf_path, pending))
+        except Exception as e:
+            print(f"Local OCR with {local_ocr.name} failed: {str(e)}")
+        pending = [page_num for page_num in pending if not has_text(results[page_num], min_chars)]
+
+    if pending and remote is not None:
+        print(f"Sending {len(pending)} pages to {remote.name}")
+        results.update(remote.extract_pages(pdf_path, pending))
+
+    return dict(sorted(results.items()))
+
+
+def main():
+    # Your API key (leave empty to stay local)
+    api_key = "YOUR_API_KEY_HERE"
+
+    # Example usage - replace with your PDF path
+    pdf_path = "UD-105.pdf"
+
+    all_text = extract_text(pdf_path, api_key)
+
+    for page_num, text in all_text.items():
+        print(f"\n--- PAGE {page_num} ---\n")
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,86 +1,284 @@
 import io
 import requests
 import base64
-from pdf2image import convert_from_path
-import tempfile
+from pdf2image import convert_from_path, pdfinfo_from_path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from collections import deque
+from PyPDF2 import PdfReader
+import hashlib
 import json
+import os
 
-def extract_all_text_from_pdf_with_api_key(pdf_path, api_key):
+VISION_API_URL = "https://vision.googleapis.com/v1/images:annotate?key={api_key}"
+
+# images:annotate accepts at most 16 images per request and about 10 MB of JSON
+MAX_IMAGES_PER_REQUEST = 16
+MAX_REQUEST_BYTES = 8 * 1024 * 1024
+
+# OCR text of previously seen pages, keyed by a hash of the page content
+OCR_CACHE_DIR = "ocr_cache"
+
+def _stream_bytes(obj):
+    try:
+        return obj.get_data()
+    except Exception:
+        return b""
+
+def _update_with_xobjects(digest, resources, seen=None):
+    """Add the XObjects of `resources` to `digest`, recursing into form XObjects
+
+    Scanned images are often wrapped in form XObjects with identical drawing
+    commands; only the nested images tell such pages apart.
+    """
+    seen = set() if seen is None else seen
+    resources = resources.get_object() if hasattr(resources, "get_object") else resources
+    xobjects = resources["/XObject"].get_object() if "/XObject" in resources else {}
+    for name in sorted(xobjects):
+        xobject = xobjects[name].get_object()
+        digest.update(name.encode())
+        digest.update(_stream_bytes(xobject))
+        if "/Resources" in xobject and id(xobject) not in seen:
+            seen.add(id(xobject))
+            _update_with_xobjects(digest, xobject["/Resources"], seen)
+
+def _annotation_bytes(annot):
+    """Field value and appearance streams of an annotation (filled form widgets live here)"""
+    data = []
+    for holder in (annot, annot["/Parent"].get_object() if "/Parent" in annot else {}):
+        if "/V" in holder:
+            data.append(f"V={holder['/V']}".encode())
+    appearances = annot["/AP"].get_object() if "/AP" in annot else {}
+    for key in sorted(appearances):
+        appearance = appearances[key].get_object()
+        if hasattr(appearance, "get_data"):
+            data.append(_stream_bytes(appearance))
+        else:  # one stream per state, e.g. /On and /Off of a checkbox
+            for state in sorted(appearance):
+                data.append(state.encode())
+                data.append(_stream_bytes(appearance[state].get_object()))
+    if "/AS" in annot:
+        data.append(f"AS={annot['/AS']}".encode())
+    return b"".join(data)
+
+def page_fingerprints(pdf_path, dpi=300):
+    """Hash of each page's content stream, images, annotations and size, keyed by page number
+
+    Pages whose content cannot be read get None and are always OCRed.
+    """
+    fingerprints = {}
+    reader = PdfReader(pdf_path)
+    for page_num, page in enumerate(reader.pages, start=1):
+        try:
+            digest = hashlib.sha256(f"dpi={dpi};box={list(page.mediabox)}".encode())
+            contents = page.get_contents()
+            if contents is not None:
+                digest.update(_stream_bytes(contents))
+            # Scanned pages share the same drawing commands; the images tell them apart
+            _update_with_xobjects(digest, page["/Resources"] if "/Resources" in page else {})
+            # Filled form fields are drawn from their annotations, not the content stream
+            for annot in (page["/Annots"].get_object() if "/Annots" in page else []):
+                digest.update(_annotation_bytes(annot.get_object()))
+            fingerprints[page_num] = digest.hexdigest()
+        except Exception:
+            fingerprints[page_num] = None
+    return fingerprints
+
+def cached_page_text(fingerprint, cache_dir=OCR_CACHE_DIR):
+    if fingerprint is None:
+        return None
+    try:
+        with open(os.path.join(cache_dir, f"{fingerprint}.txt"), "r", encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+def cache_page_text(fingerprint, text, cache_dir=OCR_CACHE_DIR):
+    if fingerprint is None or text.startswith("ERROR:"):
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{fingerprint}.txt")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def render_page(pdf_path, page_num, dpi=300):
+    """Rasterize a single PDF page and return it as base64-encoded PNG"""
+    images = convert_from_path(
+        pdf_path,
+        dpi=dpi,
+        first_page=page_num,
+        last_page=page_num,
+        fmt="png"
+    )
+    img_byte_arr = io.BytesIO()
+    images[0].save(img_byte_arr, format='PNG')
+    images[0].close()
+    return base64.b64encode(img_byte_arr.getvalue()).decode('utf-8')
+
+def iter_rendered_pages(pdf_path, page_numbers, raster_pool, prefetch=4, dpi=300):
+    """Yield (page_num, base64 PNG) in page order, rasterizing at most `prefetch` pages ahead
+
+    Only the pages being rasterized are held at any time, so memory stays flat
+    regardless of the page count and the first page is available right away.
+    """
+    page_numbers = iter(page_numbers)
+    pending = deque()
+
+    def schedule_next():
+        page_num = next(page_numbers, None)
+        if page_num is not None:
+            pending.append((page_num, raster_pool.submit(render_page, pdf_path, page_num, dpi)))
+
+    for _ in range(max(1, prefetch)):
+        schedule_next()
+
+    while pending:
+        page_num, page_future = pending.popleft()
+        schedule_next()
+        yield page_num, page_future.result()
+
+def annotate_batch(session, vision_api_url, batch):
+    """OCR a batch of (page_num, base64 PNG) pages with one images:annotate request
+
+    Returns a dictionary with page numbers as keys and extracted text as values.
+    """
+    request_json = {
+        "requests": [
+            {
+                "image": {
+                    "content": img_content
+                },
+                "features": [
+                    {
+                        "type": "DOCUMENT_TEXT_DETECTION"
+                    }
+                ]
+            }
+            for _, img_content in batch
+        ]
+    }
+
+    response = session.post(vision_api_url, json=request_json)
+
+    results = {}
+    if response.status_code != 200:
+        print(f"Error on pages {batch[0][0]}-{batch[-1][0]}: {response.text}")
+        for page_num, _ in batch:
+            results[page_num] = f"ERROR: {response.status_code}"
+        return results
+
+    responses = response.json().get('responses', [])
+    for (page_num, _), page_response in zip(batch, responses):
+        # Extract full text
+        try:
+            results[page_num] = page_response['fullTextAnnotation']['text']
+        except KeyError:
+            if 'error' in page_response:
+                print(f"Error on page {page_num}: {page_response['error'].get('message')}")
+                results[page_num] = f"ERROR: {page_response['error'].get('code')}"
+            else:
+                print(f"No text found on page {page_num}")
+                results[page_num] = ""
+    return results
+
+def extract_all_text_from_pdf_with_api_key(pdf_path, api_key, batch_size=8, max_in_flight=4,
+                                           raster_workers=None, dpi=300, prefetch=4,
+                                           max_buffered_bytes=64 * 1024 * 1024, cache_dir=OCR_CACHE_DIR,
+                                           pages=None):
     """
     Extract all text from each page of a PDF using Google Cloud Vision API with an API key.
-    
+
+    Pages are rasterized one at a time in a process pool (at most `prefetch`
+    ahead of the OCR), grouped into batches of up to `batch_size` images per
+    images:annotate request, and up to `max_in_flight` requests are kept
+    running on a pooled HTTP session. Encoded pages waiting for or inside a
+    request are capped at `max_buffered_bytes`; beyond that the pipeline waits
+    for the oldest request to finish, so memory stays flat for long filings.
+
+    Page text is cached under `cache_dir` by a hash of the page's content, so
+    re-running on the same or an amended PDF only OCRs the changed pages.
+
     Args:
         pdf_path: Path to the PDF file
         api_key: Your Google Cloud Vision API key
-        
+        batch_size: Pages per Vision request (at most 16)
+        max_in_flight: Concurrent Vision requests
+        raster_workers: Processes used to rasterize pages (default: `prefetch`)
+        dpi: Rasterization resolution; higher DPI gives better OCR quality
+        prefetch: Pages rasterized ahead of the OCR requests
+        max_buffered_bytes: Memory ceiling for encoded page images
+        cache_dir: Directory of the per-page OCR cache (None disables it)
+        pages: Page numbers to OCR (default: every page)
+
     Returns:
         A dictionary with page numbers as keys and extracted text as values
     """
     # API endpoint
-    vision_api_url = f"https://vision.googleapis.com/v1/images:annotate?key={api_key}"
-    
-    # Convert PDF to images
-    print(f"Converting PDF to images: {pdf_path}")
-    with tempfile.TemporaryDirectory() as temp_dir:
-        images = convert_from_path(
-            pdf_path,
-            dpi=300,  # Higher DPI for better quality
-            output_folder=temp_dir,
-            fmt="png"
-        )
-        
-        results = {}
-        
-        # Process each page
-        for i, image in enumerate(images):
-            page_num = i + 1
-            print(f"Processing page {page_num}/{len(images)}")
-            
-            # Save image to memory buffer
-            img_byte_arr = io.BytesIO()
-            image.save(img_byte_arr, format='PNG')
-            img_byte_arr.seek(0)
-            
-            # Encode image
-            img_content = base64.b64encode(img_byte_arr.read()).decode('utf-8')
-            
-            # Create request payload
-            request_json = {
-                "requests": [
-                    {
-                        "image": {
-                            "content": img_content
-                        },
-                        "features": [
-                            {
-                                "type": "DOCUMENT_TEXT_DETECTION"
-                            }
-                        ]
-                    }
-                ]
-            }
-            
-            # Make API request
-            response = requests.post(
-                vision_api_url,
-                json=request_json
-            )
-            
-            if response.status_code == 200:
-                response_data = response.json()
-                
-                # Extract full text
-                try:
-                    text = response_data['responses'][0]['fullTextAnnotation']['text']
-                    results[page_num] = text
-                except KeyError:
-                    print(f"No text found on page {page_num}")
-                    results[page_num] = ""
-            else:
-                print(f"Error on page {page_num}: {response.text}")
-                results[page_num] = f"ERROR: {response.status_code}"
-                
-        return results
+    vision_api_url = VISION_API_URL.format(api_key=api_key)
+    batch_size = max(1, min(batch_size, MAX_IMAGES_PER_REQUEST))
+
+    page_count = pdfinfo_from_path(pdf_path)["Pages"]
+    if pages is None:
+        pages = range(1, page_count + 1)
+    pages = sorted(set(pages))
+
+    results = {}
+    fingerprints = {}
+    if cache_dir is not None:
+        fingerprints = page_fingerprints(pdf_path, dpi)
+        for page_num in pages:
+            text = cached_page_text(fingerprints.get(page_num), cache_dir)
+            if text is not None:
+                results[page_num] = text
+    missing_pages = [page_num for page_num in pages if page_num not in results]
+    if not missing_pages:
+        print(f"All {len(pages)} pages found in the OCR cache")
+        return dict(sorted(results.items()))
+    print(f"Converting {len(missing_pages)} of {page_count} PDF pages to images: {pdf_path}")
+
+    with ProcessPoolExecutor(max_workers=raster_workers or max(1, prefetch)) as raster_pool, \
+            ThreadPoolExecutor(max_workers=max_in_flight) as request_pool, \
+            requests.Session() as session:
+        session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight))
+
+        in_flight = deque()
+        in_flight_bytes = 0
+
+        def send(batch, batch_bytes):
+            nonlocal in_flight_bytes
+            # Stay under the memory ceiling by waiting for the oldest requests first
+            while in_flight and in_flight_bytes + batch_bytes > max_buffered_bytes:
+                request_future, done_bytes = in_flight.popleft()
+                results.update(request_future.result())
+                in_flight_bytes -= done_bytes
+            in_flight.append((request_pool.submit(annotate_batch, session, vision_api_url, batch), batch_bytes))
+            in_flight_bytes += batch_bytes
+
+        # Send a batch as soon as it is full, while later pages are still rasterizing
+        batch = []
+        batch_bytes = 0
+        pages = iter_rendered_pages(pdf_path, missing_pages, raster_pool, prefetch, dpi)
+        for page_num, img_content in pages:
+            if batch and (len(batch) == batch_size or batch_bytes + len(img_content) > MAX_REQUEST_BYTES):
+                send(batch, batch_bytes)
+                batch = []
+                batch_bytes = 0
+            batch.append((page_num, img_content))
+            batch_bytes += len(img_content)
+            print(f"Rasterized page {page_num}/{page_count}")
+        if batch:
+            send(batch, batch_bytes)
+
+        for request_future, _ in in_flight:
+            results.update(request_future.result())
+
+    if cache_dir is not None:
+        for page_num in missing_pages:
+            cache_page_text(fingerprints.get(page_num), results.get(page_num, "ERROR:"), cache_dir)
+
+    return dict(sorted(results.items()))
 
 def main():
     # Your API key
@@ -97,8 +295,13 @@ def main():
         print(f"\n--- PAGE {page_num} ---\n")
         print(text)
         
-        # Optionally save to file
-        with open(f"page_{page_num}_text.txt", "w") as f:
+        # Optionally save to file (unchanged pages are left alone)
+        page_path = f"page_{page_num}_text.txt"
+        if os.path.exists(page_path):
+            with open(page_path, "r") as f:
+                if f.read() == text:
+                    continue
+        with open(page_path, "w") as f:
             f.write(text)
 
 if __name__ == "__main__":
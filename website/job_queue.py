@@ -0,0 +1,116 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class JobLog(list):
+    """Processing log of a job that also records every message as a timed progress event
+
+    Each event is a dict with a sequence `id`, a `stage` name, the `message`,
+    the seconds `elapsed` since the job was created and optional `data`.
+    """
+    def __init__(self, created):
+        super().__init__()
+        self.events = []
+        self.condition = threading.Condition()
+        self._created = created
+
+    def append(self, message, stage="log", **data):
+        super().append(message)
+        event = {
+            "id": len(self.events) + 1,
+            "stage": stage,
+            "message": message,
+            "elapsed": round(time.time() - self._created, 3),
+        }
+        if data:
+            event["data"] = data
+        with self.condition:
+            self.events.append(event)
+            self.condition.notify_all()
+
+    def events_after(self, last_id, timeout=None):
+        """Events newer than `last_id`, waiting up to `timeout` seconds for one to arrive"""
+        with self.condition:
+            self.condition.wait_for(lambda: len(self.events) > last_id, timeout)
+            return self.events[last_id:]
+
+
+class Job:
+    """One queued document generation request"""
+    def __init__(self, options):
+        self.id = uuid.uuid4().hex
+        self.options = options
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.log = JobLog(self.created)
+        self.files = []
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "error": self.error,
+            "log": list(self.log),
+        }
+
+
+class JobQueue:
+    """In-process job queue with a bounded pool of worker threads
+
+    Finished jobs are kept for lookup until more than `max_jobs` exist, then
+    the oldest finished ones are dropped.
+    """
+    def __init__(self, max_workers=2, max_jobs=200):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="caci-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_jobs = max_jobs
+
+    def submit(self, fn, *args, **options):
+        """Queue `fn(job, *args)` and return the new job immediately"""
+        job = Job(options)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, fn, args)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, fn, args):
+        job.status = "running"
+        job.started = time.time()
+        job.log.append("Job started", stage="running")
+        try:
+            job.result = fn(job, *args)
+            job.finished = time.time()
+            job.status = "done"
+            job.log.append("Job finished", stage="done")
+        except Exception as e:
+            job.finished = time.time()
+            job.error = str(e)
+            job.status = "failed"
+            job.log.append(f"Job failed: {job.error}", stage="failed")
+            logger.error(f"Job {job.id} failed: {job.error}")
+
+    def _prune(self):
+        excess = len(self._jobs) - self.max_jobs
+        if excess <= 0:
+            return
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished][:excess]:
+            del self._jobs[job_id]
@@ -1,19 +1,28 @@
 import os
-import re
 import json
 import tempfile
 import shutil
 import logging
 import time
-from flask import Flask, request, render_template_string, send_file
+from flask import Flask, request, render_template_string, send_file, jsonify, Response
 from docx import Document
 from docx.shared import RGBColor, Pt
-import pathlib
 import datetime
+import sys
 
 # Import Google GenAI
 from google import genai
-from google.genai import types
+
+# Shared pipeline modules live in the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from case_cache import get_case_info
+from template_uploads import call_with_template_file
+from blueprint_store import load_blueprint, blueprint_text_path, form_slice, form_text, expand_form, COMPACT_FORMAT_NOTE
+from case_facts import form_placeholders, resolve_with_model, fill_placeholders
+from json_parser import extract_json_objects
+from structured_output import json_config, FORM_SCHEMA, COMPACT_FORM_SCHEMA
+from docx_renderer import load_template_body
+from job_queue import JobQueue
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -25,6 +34,52 @@ app = Flask(__name__)
 RESPONSE_LOGS_DIR = "gemini_responses"
 os.makedirs(RESPONSE_LOGS_DIR, exist_ok=True)
 
+# Optional master template (.docx); its compiled blueprint is loaded once at startup
+MASTER_TEMPLATE_PATH = os.environ.get("CACI_MASTER_TEMPLATE")
+MASTER_BLUEPRINT = load_blueprint(MASTER_TEMPLATE_PATH) if MASTER_TEMPLATE_PATH else None
+
+# Generation jobs run here, off the request threads
+jobs = JobQueue(max_workers=int(os.environ.get("CACI_JOB_WORKERS", "2")))
+
+# Page shown while a job runs; it follows the job's progress events until the result is ready
+JOB_TEMPLATE = """
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <title>Generating CACI Forms</title>
+    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
+    <style>
+        pre { background-color: #f5f5f5; padding: 15px; border-radius: 5px; overflow-x: auto; }
+    </style>
+</head>
+<body>
+    <div class="container mt-5">
+        <h1>Generating CACI Forms</h1>
+        <p>Job <code>{{ job_id }}</code>: <strong id="status">queued</strong></p>
+        <pre id="log"></pre>
+        <a href="/" class="btn btn-secondary">Back to Form</a>
+    </div>
+    <script>
+        // Progress events are streamed from the server as the job runs
+        const log = document.getElementById("log");
+        const source = new EventSource("/jobs/{{ job_id }}/events");
+        function show(e) {
+            const event = JSON.parse(e.data);
+            document.getElementById("status").textContent = event.stage;
+            log.textContent += "[" + event.elapsed.toFixed(1) + "s] " + event.message + "\\n";
+            if (event.result_url) {
+                source.close();
+                window.location = event.result_url;
+            }
+        }
+        ["log", "running", "upload", "case_info", "form", "docx_saved", "done", "failed"].forEach(
+            stage => source.addEventListener(stage, show));
+    </script>
+</body>
+</html>
+"""
+
 # HTML template for the form
 HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -101,7 +156,8 @@ HTML_TEMPLATE = """
             <div class="upload-section mt-3">
                 <h4>CACI Template (DOCX)</h4>
                 <p>Upload the Jury Instruction Template document</p>
-                <input type="file" class="form-control" name="template_file" accept=".txt" required>
+                <input type="file" class="form-control" name="template_file" accept=".txt" {{ '' if master_template else 'required' }}>
+                {% if master_template %}<p class="text-muted mt-2">Leave empty to use the server's master template</p>{% endif %}
             </div>
 
             <div class="form-check mt-3">
@@ -128,22 +184,57 @@ HTML_TEMPLATE = """
 @app.route('/', methods=['GET'])
 def index():
     # Render the HTML form
-    return render_template_string(HTML_TEMPLATE)
+    return render_template_string(HTML_TEMPLATE, master_template=MASTER_BLUEPRINT is not None)
 
 @app.route('/process', methods=['POST'])
 def process():
-    # Create a temporary directory for all processing
+    # Save the uploads in the request thread; the Gemini calls and rendering run in the job queue
     temp_dir = tempfile.mkdtemp()
     debug_mode = 'debug_mode' in request.form
     save_responses = 'save_responses' in request.form
     debug_output = []
     
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    response_log_files = []
+    try:
+        # Save uploaded files to temp directory
+        
+        laciv_file = request.files['laciv_file']
+        case_file = request.files['case_file']
+        template_file = request.files.get('template_file')
+        
+        laciv_path = os.path.join(temp_dir, secure_filename(laciv_file.filename))
+        case_path = os.path.join(temp_dir, secure_filename(case_file.filename))
+        if template_file and template_file.filename:
+            template_path = os.path.join(temp_dir, secure_filename(template_file.filename))
+            template_file.save(template_path)
+        elif MASTER_BLUEPRINT is not None:
+            template_path = blueprint_text_path(MASTER_BLUEPRINT)
+        else:
+            raise ValueError("No template file uploaded and no master template configured")
+        
+        laciv_file.save(laciv_path)
+        case_file.save(case_path)
+    
+    except Exception as e:
+        error_message = f"Error: {str(e)}"
+        logger.error(error_message)
+        return render_error_page(error_message, debug_output), 400
+    
+    job = jobs.submit(generate_forms, temp_dir, case_path, template_path,
+                      debug_mode=debug_mode, save_responses=save_responses)
+    
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({"job_id": job.id, "status_url": f"/jobs/{job.id}"}), 202
+    return render_template_string(JOB_TEMPLATE, job_id=job.id), 202
 
+def generate_forms(job, temp_dir, case_path, template_path):
+    """Run the Gemini calls and DOCX rendering of one /process submission"""
+    debug_output = job.log
+    response_log_files = job.files
+    save_responses = job.options["save_responses"]
+    
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     
     def save_response_to_file(response_text, label):
-        import json
         if save_responses:
             filename = f"{timestamp}_{label}.txt"
             filepath = os.path.join(RESPONSE_LOGS_DIR, filename)
@@ -154,63 +245,37 @@ def process():
             return filepath
         return None
     
+    debug_output.append("Files saved successfully", stage="upload")
+    
+    # Output paths
+    output_path = os.path.join(temp_dir, 'final_output.docx')
+    
+    # Set up the API key
+    api_key = "ADD API KEY"  # Replace with your actual API key
+    client = genai.Client(api_key=api_key)
+    debug_output.append("Getting case information from PDF...")
+    
     try:
-        # Save uploaded files to temp directory
-        
-        laciv_file = request.files['laciv_file']
-        case_file = request.files['case_file']
-        template_file = request.files['template_file']
-        
-        laciv_path = os.path.join(temp_dir, secure_filename(laciv_file.filename))
-        case_path = os.path.join(temp_dir, secure_filename(case_file.filename))
-        template_path = os.path.join(temp_dir, secure_filename(template_file.filename))
-        
-        laciv_file.save(laciv_path)
-        case_file.save(case_path)
-        template_file.save(template_path)
-        
-        debug_output.append(f"Files saved successfully")
-        
-        # Output paths
-        output_path = os.path.join(temp_dir, 'final_output.docx')
-        
-        # Set up the API key
-        api_key = "ADD API KEY"  # Replace with your actual API key
-        client = genai.Client(api_key=api_key)
-        filepath = pathlib.Path(case_path)
-        prompt = 'Give me all information you have about the case'
-        
-        debug_output.append("Getting case information from PDF...")
+        case_info, cached = get_case_info(client, case_path)
+        if cached:
+            debug_output.append("Case information loaded from cache")
+        debug_output.append(f"Case information received ({len(case_info)} characters)", stage="case_info")
         
-        try:
-            response = client.models.generate_content(
-                model="gemini-2.0-flash-exp",
-                contents=[
-                    types.Part.from_bytes(
-                        data=filepath.read_bytes(),
-                        mime_type='application/pdf',
-                    ),
-                    prompt
-                ]
-            )
-            case_info = response.text
-            debug_output.append(f"Case information received ({len(case_info)} characters)")
-            
-            # Save the case information response
-            save_response_to_file(case_info, "case_info")
-            
-        except Exception as e:
-            error_msg = f"Error getting case info: {str(e)}"
-            debug_output.append(error_msg)
-            logger.error(error_msg)
-            raise
+        # Save the case information response
+        save_response_to_file(case_info, "case_info")
         
-        # Now try to process template in simpler way
-        # APPROACH 1: Try generating JSON with explicit structure
-        debug_output.append("Attempting to generate form with JSON structure...")
-        
-        # First try with a more explicit JSON structure
-        json_prompt = f"""Legal Document Generation Task:
+    except Exception as e:
+        error_msg = f"Error getting case info: {str(e)}"
+        debug_output.append(error_msg)
+        logger.error(error_msg)
+        raise
+    
+    # Now try to process template in simpler way
+    # APPROACH 1: Try generating JSON with explicit structure
+    debug_output.append("Attempting to generate form with JSON structure...")
+    
+    # First try with a more explicit JSON structure
+    json_prompt = f"""Legal Document Generation Task:
     Fill in the CACI template for this given CACI form using the provided context: "CACI Number": "101", "Jury Instructions": "Overview of Trial". Use this as context: {case_info} to fill the form placeholders. Use the context and fill in placeholder such as defendant/plaintiff/city/address. Make your best guess for the placeholders. I want to see all placeholders filled. Dont output anything else. Keep the output in the same format as the input. JSON format, with the same attributes as the provided doc, you only need to change the text as you see fit.
     Use the same attributes as the provided text with the same styling. I need the same format as input. JSON format with the style, run, text, everything in style formatting. Fill the entire CACI form.  I need the entire form bro, i dont get what you are not understanding. I only need the CACI 101 form: Overview of a trial. I dont need superflous stuff
     Ignore any lines of this form. I only need the CACI 101:Overview of Trial. Your response should be one JSON file only with records being separated by commas. Only the form style json, no placeholders, nothing apart from the filled form w style details
@@ -224,43 +289,55 @@ def process():
       
     ]
     Output:"""
-        
+    
+    # The master template is sent in the blueprint's compact form, with format ids instead of run styling
+    compact = MASTER_BLUEPRINT is not None and template_path == blueprint_text_path(MASTER_BLUEPRINT)
+    if compact:
+        json_prompt = json_prompt.replace("Output:", f"{COMPACT_FORMAT_NOTE}\n    Output:")
+    
+    extracted_json_data = None
+    json_result = None
+    values = None
+    # With the master template indexed, the model only returns values for the CACI 101 placeholders
+    paragraphs = form_slice(MASTER_BLUEPRINT, "101") if compact else None
+    if paragraphs is not None:
+        try:
+            placeholders = form_placeholders(paragraphs)
+            debug_output.append(f"Filling {len(placeholders)} placeholders of the CACI 101 template paragraphs")
+            values = resolve_with_model(client, "101", placeholders, case_info) if placeholders else {}
+            save_response_to_file(json.dumps(values, ensure_ascii=False, indent=2), "placeholder_values")
+            extracted_json_data = fill_placeholders(paragraphs, values)
+        except Exception as e:
+            error_msg = f"Error filling placeholders, asking for the whole form: {str(e)}"
+            debug_output.append(error_msg)
+            logger.error(error_msg)
+    
+    if extracted_json_data is None:
         try:
-            myfile = client.files.upload(file=template_path)
-            json_response = client.models.generate_content(
-                model="gemini-2.0-flash-exp",
-                contents=[json_prompt, myfile]
-            )
+            # With the master template loaded, send only the CACI 101 paragraphs
+            def fill(myfile):
+                return client.models.generate_content(
+                    model="gemini-2.0-flash-exp",
+                    contents=[json_prompt, myfile],
+                    config=json_config(COMPACT_FORM_SCHEMA if compact else FORM_SCHEMA)
+                )
+        
+            form_paragraphs = form_text(MASTER_BLUEPRINT, "101") if compact else None
+            if form_paragraphs is not None:
+                debug_output.append("Using the template paragraphs of CACI 101")
+                json_response = fill(form_paragraphs)
+            else:
+                # Uploaded again if Gemini no longer has the previous upload
+                json_response = call_with_template_file(client, template_path, fill)
             json_result = json_response.text
             json_response_path = save_response_to_file(json_result, "json_response")
             debug_output.append(f"JSON response received ({len(json_result)} characters)")
-            extracted_json_data = None
             try:
-                def extract_json_objects(text):
-                    print(text)
-                    match = re.search(r'```json\s*(.*?)\s*```', text, re.DOTALL)
-                    if not match:
-                        raise ValueError("No JSON block found.")
-
-                    json_block = match.group(1)
-                    json_block = re.sub(r'\}\s*,?\s*\{', '},{', json_block)
-                    json_block = f"[{json_block}]"
-
-                    try:
-                        parsed = json.loads(json_block)
-                    except json.JSONDecodeError as e:
-                        raise ValueError(f"Invalid JSON: {e}")
-
-                    return parsed
-                json_match = re.search(r'\[\s*\{.*\}\s*\]', json_result, re.DOTALL)
-                if json_match:
-                    json_text = json_match.group(0)
-                else:
-                    match = re.search(r'```(?:json)?\s*(.*?)```', json_result, re.DOTALL)
-                    if match:
-                        json_text = match.group(1)
-                    else:
-                        json_text = json_result
+                # One pass over the reply; the parsed JSON is what gets saved and rendered
+                extracted_json_data = extract_json_objects(json_result)
+                if compact:
+                    extracted_json_data = expand_form(extracted_json_data, MASTER_BLUEPRINT)
+                json_text = json.dumps(extracted_json_data, ensure_ascii=False, indent=2)
 
                 raw_json_path = os.path.join(RESPONSE_LOGS_DIR, f"{timestamp}_raw_json.json")
                 with open(raw_json_path, 'w', encoding='utf-8') as f:
@@ -268,53 +345,135 @@ def process():
                 response_log_files.append(raw_json_path)
                 debug_output.append(f"Raw JSON saved to: {raw_json_path}")
             except Exception as e:
-                debug_output.append(f"Error saving raw JSON: {str(e)}")
-        
+                debug_output.append(f"Error parsing or saving raw JSON: {str(e)}")
+    
         except Exception as e:
             error_msg = f"Error generating JSON: {str(e)}"
             debug_output.append(error_msg)
             logger.error(error_msg)
             json_result = None
-        def color_from_hex(hexstr):
-            if isinstance(hexstr, list):
-                return RGBColor(*hexstr)
-            if not hexstr or hexstr.lower() == "auto":
-                return None
-            hexstr = hexstr.lstrip('#')
-            return RGBColor(int(hexstr[0:2], 16), int(hexstr[2:4], 16), int(hexstr[4:6], 16))
-        def json_to_docx(json_data, docx_path, template_path=None):
-            if template_path:
-                shutil.copyfile(template_path, docx_path)
-                doc = Document(docx_path)
-                for element in reversed(doc.paragraphs):
-                    element.clear()
-            else:
-                doc = Document()
-            for para in json_data:
-                new_para = doc.add_paragraph(style=para.get("style", "Normal"))
-                for run_info in para["runs"]:
-                    run = new_para.add_run(run_info["text"])
-                    run.bold = run_info.get("bold", False)
-                    run.italic = run_info.get("italic", False)
-                    if "color" in run_info:
-                        run.font.color.rgb = color_from_hex(run_info["color"])
-            print("YESYSYYSYS")
+    def color_from_hex(hexstr):
+        if isinstance(hexstr, list):
+            return RGBColor(*hexstr)
+        if not hexstr or hexstr.lower() == "auto":
+            return None
+        hexstr = hexstr.lstrip('#')
+        return RGBColor(int(hexstr[0:2], 16), int(hexstr[2:4], 16), int(hexstr[4:6], 16))
+    def json_to_docx(json_data, docx_path, template_path=None):
+        if template_path:
+            shutil.copyfile(template_path, docx_path)
+            doc = Document(docx_path)
+            for element in reversed(doc.paragraphs):
+                element.clear()
+        else:
+            doc = Document()
+        for para in json_data:
+            new_para = doc.add_paragraph(style=para.get("style", "Normal"))
+            for run_info in para["runs"]:
+                run = new_para.add_run(run_info["text"])
+                run.bold = run_info.get("bold", False)
+                run.italic = run_info.get("italic", False)
+                if "color" in run_info:
+                    run.font.color.rgb = color_from_hex(run_info["color"])
+        print("YESYSYYSYS")
 
-            doc.save(docx_path)
-        data = extract_json_objects(json_result)
-        for item in data:
-            if "style" in item and isinstance(item["style"], str):
-                item["style"] = item["style"].capitalize()  
+        doc.save(docx_path)
+    if extracted_json_data is not None:
+        data = extracted_json_data
+    else:
+        data = extract_json_objects(json_result or "")
+        if compact:
+            data = expand_form(data, MASTER_BLUEPRINT)
+    for item in data:
+        # Only fix all-lowercase names ("normal"); template names like "List Paragraph" are kept as is
+        if "style" in item and isinstance(item["style"], str) and item["style"].islower():
+            item["style"] = item["style"].capitalize()  
+    # Stream the filled form to listeners before the document is rendered
+    debug_output.append("Form 1/1 filled: CACI 101", stage="form",
+                        index=1, total=1, caci_number="101", paragraphs=data)
+    # With the master template's .docx, the form is written into a copy of its package (styles, numbering, layout)
+    template_body = None
+    if compact:
+        try:
+            template_body = load_template_body(MASTER_TEMPLATE_PATH, MASTER_BLUEPRINT)
+        except Exception as e:
+            debug_output.append(f"Could not reuse the template package, rendering from scratch: {str(e)}")
+    if template_body is not None:
+        builder = template_body.builder()
+        form_xml = template_body.form_xml("101", values) if values is not None else None
+        if form_xml is not None:
+            # The template's own CACI 101 body with only the placeholder runs patched
+            builder.add_xml(form_xml)
+        else:
+            builder.add_paragraphs(data)
+        builder.save(output_path)
+    else:
         json_to_docx(
             data,
             output_path,
         )
-        print('DONE')
-        debug_output.append(f"Document saved with response information")
-        
-        # Render debug page or send file
-        if debug_mode:
-            debug_html = f"""
+    print('DONE')
+    debug_output.append(f"Document saved with response information", stage="docx_saved")
+    
+    return output_path
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    # Poll a queued job's status and processing log
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    status = job.to_dict()
+    status["result_url"] = f"/jobs/{job.id}/result"
+    return jsonify(status)
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    # Server-Sent Events stream of a job's progress, ending with its "done" or "failed" event
+    job = jobs.get(job_id)
+    if job is None:
+        return "Job not found", 404
+    last_id = int(request.headers.get('Last-Event-ID', 0) or 0)
+    
+    def stream():
+        nonlocal last_id
+        while True:
+            events = job.log.events_after(last_id, timeout=15)
+            if not events:
+                # Keep idle connections open through proxies
+                yield ": keep-alive\n\n"
+                continue
+            for event in events:
+                last_id = event["id"]
+                if event["stage"] in ("done", "failed"):
+                    event = dict(event, result_url=f"/jobs/{job.id}/result")
+                yield f"id: {event['id']}\nevent: {event['stage']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+                if event["stage"] in ("done", "failed"):
+                    return
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    # Show the outcome of a finished job, or the waiting page while it still runs
+    job = jobs.get(job_id)
+    if job is None:
+        return "Job not found", 404
+    if job.status in ("queued", "running"):
+        return render_template_string(JOB_TEMPLATE, job_id=job.id), 202
+    
+    if job.status == "failed":
+        return render_error_page(f"Error: {job.error}", job.log), 500
+    
+    debug_output = job.log
+    response_log_files = job.files
+    
+    output_path = job.result
+    
+    # Render debug page or send file
+    if job.options["debug_mode"]:
+        debug_html = f"""
             <!DOCTYPE html>
             <html>
             <head>
@@ -334,7 +493,7 @@ def process():
                     </div>
                     
                     <div class="mb-3">
-                        <a href="/download/{os.path.basename(output_path)}" class="btn btn-primary">Download Summary Document</a>
+                        <a href="/jobs/{job.id}/download" class="btn btn-primary">Download Summary Document</a>
                         <a href="/" class="btn btn-secondary ms-2">Back to Form</a>
                     </div>
                     
@@ -361,50 +520,49 @@ def process():
             </body>
             </html>
             """
-            
-            return render_template_string(debug_html)
-        else:
-            # Send file directly
-            return send_file(output_path, as_attachment=True, download_name='responses_summary.docx')
-            
-    except Exception as e:
-        error_message = f"Error: {str(e)}"
-        logger.error(error_message)
         
-        error_html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Error</title>
-            <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
-        </head>
-        <body>
-            <div class="container mt-5">
-                <div class="alert alert-danger">
-                    <h4>Error Occurred</h4>
-                    <p>{error_message}</p>
-                </div>
-                
-                <div class="card mt-3">
-                    <div class="card-header">Debug Information</div>
-                    <div class="card-body">
-                        <pre>{os.linesep.join(debug_output)}</pre>
-                    </div>
+        return render_template_string(debug_html)
+    else:
+        # Send file directly
+        return send_file(output_path, as_attachment=True, download_name='responses_summary.docx')
+
+@app.route('/jobs/<job_id>/download', methods=['GET'])
+def job_download(job_id):
+    # Download the generated document of a finished job
+    job = jobs.get(job_id)
+    if job is None or job.status != "done":
+        return "File not found", 404
+    return send_file(job.result, as_attachment=True, download_name='responses_summary.docx')
+
+def render_error_page(error_message, debug_output):
+    """Error page with the processing log so far"""
+    error_html = f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <title>Error</title>
+        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
+    </head>
+    <body>
+        <div class="container mt-5">
+            <div class="alert alert-danger">
+                <h4>Error Occurred</h4>
+                <p>{error_message}</p>
+            </div>
+            
+            <div class="card mt-3">
+                <div class="card-header">Debug Information</div>
+                <div class="card-body">
+                    <pre>{os.linesep.join(debug_output)}</pre>
                 </div>
-                
-                <a href="/" class="btn btn-primary mt-3">Back to Form</a>
             </div>
-        </body>
-        </html>
-        """
-        
-        return render_template_string(error_html), 500
-    
-    finally:
-        # In a production environment, you would uncomment this to clean up
-        # For debugging purposes, we're leaving the temp files
-        # shutil.rmtree(temp_dir, ignore_errors=True)
-        pass
+            
+            <a href="/" class="btn btn-primary mt-3">Back to Form</a>
+        </div>
+    </body>
+    </html>
+    """
+    return render_template_string(error_html)
 
 @app.route('/download/<filename>', methods=['GET'])
 def download_file(filename):